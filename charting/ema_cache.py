@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 18:21:37 2026
+
+ema_cache.py
+
+Content-addressed cache of EMA maps: a map is stored under a hash of
+the price data and of every parameter used to compute it, so that
+changed inputs are never served a stale map
+
+@author: charles mégnin
+"""
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+from charting import trading_defaults as dft
+from finance import utilities as util
+
+CACHE_VERSION = 1 # bump when the map computation changes
+
+
+class EmaMapCache():
+    '''
+    Cache of EMA maps under dft.DATA_DIR/dft.EMA_CACHE_DIR:
+    key.npy -> (spans x buffers) EMA map
+    key.npz -> statistics layers of the map, if any
+    key.json -> hold & description of the map
+    index.json -> size & last access of each map for LRU eviction
+    index.lock -> lock of the index read-modify-writes of concurrent processes
+    '''
+    index_name = 'index.json'
+    lock_name  = 'index.lock'
+
+    def __init__(self, directory=None, max_bytes=None):
+        if directory is None:
+            directory = os.path.join(dft.DATA_DIR, dft.EMA_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = dft.EMA_CACHE_MAX_MB * 1024**2
+        self._directory = directory
+        self._max_bytes = max_bytes
+        os.makedirs(self._directory, exist_ok = True)
+
+
+    @staticmethod
+    def build_key(close, strat_pos, spans, buffers, fee, lag, init_wealth, strategy='ema'):
+        '''
+        Hash of the Close series (dates & values) over the date range and of
+        every parameter of the EMA strategy
+        strategy -> key of the strategy plugin (see strategies.Strategy.get_key)
+        '''
+        digest = hashlib.sha256()
+        digest.update(f'v{CACHE_VERSION}|{strat_pos}|{fee!r}|{lag}|{init_wealth!r}'.encode())
+        if strategy != 'ema': # EMA keys predate the strategy plugins
+            digest.update(f'|{strategy}'.encode())
+        digest.update(np.asarray(spans, dtype=np.float64).tobytes())
+        digest.update(np.asarray(buffers, dtype=np.float64).tobytes())
+        digest.update(close.index.to_numpy(dtype='datetime64[ns]').tobytes())
+        digest.update(close.to_numpy(dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+
+    def _get_path(self, key, extension):
+        '''Return the path of a cache file'''
+        return os.path.join(self._directory, f'{key}.{extension}')
+
+
+    def _read_index(self):
+        '''Return the index as a dictionary key -> {bytes, last_access}'''
+        pathname = os.path.join(self._directory, self.index_name)
+        try:
+            with open(pathname, 'r', encoding='utf-8') as index_file:
+                return json.load(index_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+
+    def _write_index(self, index):
+        '''Atomically replace the index'''
+        pathname = os.path.join(self._directory, self.index_name)
+        temp_path = f'{pathname}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as index_file:
+            json.dump(index, index_file)
+        os.replace(temp_path, pathname)
+
+
+    def _touch(self, key, n_bytes):
+        '''Record an access to key & evict least recently used maps'''
+        # read-modify-write of the index by concurrent processes (n_tickers pool)
+        with util.file_lock(os.path.join(self._directory, self.lock_name)):
+            index = self._read_index()
+            index[key] = {'bytes': n_bytes, 'last_access': time.time()}
+            self._write_index(self.evict(index))
+
+
+    def load(self, key, mmap_mode='r'):
+        '''
+        Return the cached (emas, hold, layers) for key or None if it is not cached
+        The EMA map is memory-mapped by default, layers is None if none were stored
+        '''
+        try:
+            with open(self._get_path(key, 'json'), 'r', encoding='utf-8') as header_file:
+                header = json.load(header_file)
+            emas = np.load(self._get_path(key, 'npy'), mmap_mode=mmap_mode)
+        except (FileNotFoundError, ValueError):
+            return None
+        layers = None
+        if os.path.exists(self._get_path(key, 'npz')):
+            with np.load(self._get_path(key, 'npz')) as data:
+                layers = {name: data[name] for name in data.files}
+        self._touch(key, header['bytes'])
+        return emas, header['hold'], layers
+
+
+    def store(self, key, emas, hold, description=None, layers=None):
+        '''
+        Store an EMA map & its hold under key
+        description -> optional dictionary saved with the map (ticker, dates, ...)
+        layers -> optional dictionary name -> (spans x buffers) statistics
+        '''
+        temp_path = self._get_path(f'{key}.{os.getpid()}', 'tmp.npy')
+        np.save(temp_path, np.asarray(emas, dtype=np.float64))
+        os.replace(temp_path, self._get_path(key, 'npy'))
+        n_bytes = os.path.getsize(self._get_path(key, 'npy'))
+        if layers is not None:
+            temp_path = self._get_path(f'{key}.{os.getpid()}', 'tmp.npz')
+            np.savez(temp_path, **layers)
+            os.replace(temp_path, self._get_path(key, 'npz'))
+            n_bytes += os.path.getsize(self._get_path(key, 'npz'))
+
+        header = {'hold': float(hold), 'bytes': n_bytes}
+        if description is not None:
+            header['description'] = description
+        with open(self._get_path(key, 'json'), 'w', encoding='utf-8') as header_file:
+            json.dump(header, header_file)
+        self._touch(key, n_bytes)
+
+
+    def evict(self, index):
+        '''
+        Remove least recently used maps until the cache fits in its size budget
+        Returns the updated index
+        '''
+        keys = sorted(index, key=lambda key: index[key]['last_access'])
+        total = sum(entry['bytes'] for entry in index.values())
+        while (total > self._max_bytes) and (len(keys) > 1):
+            key = keys.pop(0)
+            total -= index.pop(key)['bytes']
+            for extension in ['npy', 'npz', 'json']:
+                try:
+                    os.remove(self._get_path(key, extension))
+                except FileNotFoundError:
+                    pass
+        return index
+
+
+    def get_size(self):
+        '''Return the number of maps & total bytes recorded in the index'''
+        index = self._read_index()
+        return len(index), sum(entry['bytes'] for entry in index.values())
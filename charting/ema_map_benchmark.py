@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 16:48:02 2026
+
+ema_map_benchmark.py
+
+Compares save & load times of the EMA map file formats:
+npy (raw float array + json header) vs csv (; separated rows)
+Run from the repository root: python -m charting.ema_map_benchmark
+
+@author: charles mégnin
+"""
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+
+from charting import trading_defaults as dft
+from charting import topo_map as tpm
+
+N_REPEATS = 5 # best of N_REPEATS timings
+
+# (spans, number of buffers) of the benchmarked grids
+GRIDS = {'default' : (np.arange(dft.MIN_SPAN, dft.MAX_SPAN + 1), dft.N_BUFFERS),
+         'research': (np.arange(2, 501), 200),
+         }
+
+def build_topomap(spans, n_buffers):
+    '''Topomap with a random EMA map on the given grid'''
+    rng = np.random.default_rng(0)
+    topomap = tpm.Topomap('BENCH',
+                          [datetime(2017, 1, 2), datetime(2021, 12, 31)],
+                          'long',
+                          )
+    topomap.set_spans(spans)
+    topomap.set_buffers(np.linspace(dft.MIN_BUFF, dft.MAX_BUFF, n_buffers))
+    topomap.set_emas(rng.normal(0, .5, (spans.shape[0], n_buffers)))
+    topomap.set_hold(.25)
+    return topomap
+
+
+def best_time(func, n_repeats=N_REPEATS):
+    '''Best wall time of n_repeats calls to func in seconds'''
+    times = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(topomap, fmt):
+    '''Returns save time, load time, load + full read time & file size for fmt'''
+    rootname = os.path.join(dft.DATA_DIR, topomap.get_name(), topomap.get_ema_map_filename())
+    if fmt == 'npy':
+        read = topomap.read_binary_map
+        extensions = ['npy', 'json']
+    else:
+        read = topomap.read_csv_map
+        extensions = ['csv']
+    emas = topomap.get_emas()
+
+    save_tm = best_time(lambda: topomap.save_emas(fmt))
+    load_tm = best_time(lambda: read(rootname))
+    # memory-mapped arrays are only read when accessed
+    read_tm = best_time(lambda: (read(rootname), float(np.sum(topomap.get_emas()))))
+    size    = sum(os.path.getsize(f'{rootname}.{ext}') for ext in extensions)
+    topomap.set_emas(emas)
+    return save_tm, load_tm, read_tm, size
+
+
+def main():
+    '''Prints the save & load times of each grid in each EMA map format'''
+    dft.DATA_DIR = tempfile.mkdtemp()
+    header  = f'{"grid":<10}{"cells":>8}  {"format":<7}'
+    header += f'{"save (ms)":>11}{"load (ms)":>11}{"load+read (ms)":>16}{"size (kB)":>11}'
+    print(header)
+    try:
+        for grid, (spans, n_buffers) in GRIDS.items():
+            topomap = build_topomap(spans, n_buffers)
+            for fmt in dft.EMA_MAP_FORMATS:
+                save_tm, load_tm, read_tm, size = benchmark(topomap, fmt)
+                line  = f'{grid:<10}{spans.shape[0]*n_buffers:>8}  {fmt:<7}'
+                line += f'{save_tm*1e3:>11.2f}{load_tm*1e3:>11.2f}{read_tm*1e3:>16.2f}'
+                line += f'{size/1024:>11.1f}'
+                print(line)
+    finally:
+        shutil.rmtree(dft.DATA_DIR)
+
+
+if __name__ == '__main__':
+    main()
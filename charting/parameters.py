@@ -32,6 +32,7 @@ CTR_SFC_PLOT_FORMATS = 'html' # html or png
 
 REFRESH_YAHOO = False # Download fresh Yahoo data
 REFRESH_EMA   = False  # Recompute ema map
+N_WORKERS     = 1 # processes used to build the ema map (1: no process pool)
 
 POSITIONS = ['long', 'short']
 
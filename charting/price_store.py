@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:26:52 2026
+
+price_store.py
+
+Columnar store of the full adjusted Close & Volume history of each symbol:
+one npy file per column & a json header under DATA_DIR/symbol, in place
+of one pickled Ticker per date range. The columns are memory-mapped so
+that the processes preparing securities share the pages of a symbol and
+a Ticker of any date range is a view over a single download
+
+@author: charles mégnin
+"""
+import os
+import json
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from charting import trading_defaults as dft
+from finance import security as sec
+from finance import utilities as util
+
+
+class PriceStore():
+    '''
+    Per-symbol columnar price files:
+    symbol_prices_{dates,close,volume}.npy -> datetime64[ns] dates & float64 columns
+    symbol_prices.json -> name, currency, download period & start, last
+                          download date & number of rows
+    symbol_prices.lock -> lock of the writes & reads of the files by
+                          concurrent processes (see finance.utilities.file_lock)
+    '''
+    columns = ['dates', 'close', 'volume']
+
+    def __init__(self, directory=None):
+        '''directory -> root of the symbol directories, DATA_DIR if None'''
+        self._directory = dft.DATA_DIR if directory is None else directory
+
+
+    def get_rootname(self, symbol):
+        '''Return the path of the store files of symbol without suffix'''
+        return os.path.join(self._directory, symbol, f'{symbol}_prices')
+
+
+    def read_header(self, symbol):
+        '''Return the header of symbol, None if it is not in the store'''
+        try:
+            with open(self.get_rootname(symbol) + '.json', 'r', encoding='utf-8') as header_file:
+                return json.load(header_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+
+    def covers(self, symbol, period, dates):
+        '''
+        True if the store holds a consistent history of symbol over dates:
+        from as far back as a download of period today (the download start
+        of load_security) & up to the end date. The bars of the day of a
+        download are not stored, so the history also covers an end date
+        before its last download or an end date from today on if it was
+        downloaded today
+        dates -> date range in string format
+        '''
+        stored = self.load(symbol)
+        if stored is None:
+            return False
+        header, columns = stored
+        start = max(dates[0], util.get_start(period).strftime('%Y-%m-%d'))
+        if (header['n_rows'] == 0) or (header['start'] > start):
+            return False
+        last  = pd.Timestamp(columns['dates'][-1]).strftime('%Y-%m-%d')
+        today = datetime.now().strftime('%Y-%m-%d')
+        return ((last >= dates[1]) or (header['updated'] > dates[1])
+                or (header['updated'] >= dates[1] >= today))
+
+
+    @staticmethod
+    def get_complete_bars(data):
+        '''
+        Return the market data without the bars of today: a bar downloaded
+        during the trading day holds an incomplete close & volume
+        '''
+        today = pd.Timestamp(datetime.now().date())
+        return data[pd.to_datetime(data.Date) < today]
+
+
+    def write(self, symbol, security, period):
+        '''
+        Replaces the history of symbol with the complete bars of the market
+        data of security (a finance.security.Security downloaded over period)
+        '''
+        data = self.get_complete_bars(security.get_market_data())
+        columns = {'dates' : data.Date.to_numpy(dtype='datetime64[ns]'),
+                   'close' : data[f'Close_{symbol}'].to_numpy(dtype=np.float64),
+                   'volume': data[f'Vol_{symbol}'].to_numpy(dtype=np.float64),
+                   }
+        header = {'symbol'  : symbol,
+                  'name'    : security.get_name(),
+                  'currency': security.get_currency(),
+                  'period'  : period,
+                  'start'   : util.get_start(period).strftime('%Y-%m-%d'),
+                  'updated' : datetime.now().strftime('%Y-%m-%d'),
+                  'n_rows'  : int(columns['dates'].shape[0]),
+                  }
+        self._write_columns(symbol, columns, header)
+
+
+    def sync(self, symbol, period, overlap=dft.SYNC_OVERLAP_DAYS, rtol=dft.SYNC_RTOL):
+        '''
+        Brings the history of symbol up to date downloading only the bars
+        from its last overlap stored days on, without the security info.
+        The history is downloaded in full over period if it is not in the
+        store, starts later than a download of period today or if the
+        overlapping adjusted closes differ by more than rtol: a dividend or
+        split since the last download re-adjusted the whole history
+        The bars of today are incomplete & never stored (get_complete_bars)
+        Returns 'full', 'adjusted' (full download after an adjustment) or
+        the number of bars appended
+        '''
+        stored = self.load(symbol)
+        if (stored is None) or (stored[0]['start'] > util.get_start(period).strftime('%Y-%m-%d')):
+            self.write(symbol, sec.Security(symbol, period), period)
+            return 'full'
+        header, columns = stored
+        first = max(0, header['n_rows'] - overlap)
+        start = pd.Timestamp(columns['dates'][first]).to_pydatetime()
+        data  = sec.Security(symbol, period, start = start, info = False).get_market_data()
+        data  = self.get_complete_bars(data)
+        dates = data.Date.to_numpy(dtype='datetime64[ns]')
+        close = data[f'Close_{symbol}'].to_numpy(dtype=np.float64)
+
+        # the overlapping bars must be unchanged
+        known = columns['dates'][first:]
+        common, old, new = np.intersect1d(known, dates, return_indices=True)
+        if (common.shape[0] == 0) or not np.allclose(close[new], columns['close'][first:][old],
+                                                     rtol = rtol, atol = 0., equal_nan = True):
+            self.write(symbol, sec.Security(symbol, period), period)
+            return 'adjusted'
+
+        tail = dates > known[-1]
+        columns = {'dates' : np.concatenate([columns['dates'], dates[tail]]),
+                   'close' : np.concatenate([columns['close'], close[tail]]),
+                   'volume': np.concatenate([columns['volume'],
+                                             data[f'Vol_{symbol}'].to_numpy(dtype=np.float64)[tail]]),
+                   }
+        header = {**header,
+                  'updated': datetime.now().strftime('%Y-%m-%d'),
+                  'n_rows' : int(columns['dates'].shape[0]),
+                  }
+        self._write_columns(symbol, columns, header)
+        return int(np.count_nonzero(tail))
+
+
+    def _write_columns(self, symbol, columns, header):
+        '''
+        Writes the columns & header of symbol: each file is written to a new
+        file of the process first, the current one may be memory-mapped by
+        another process. Readers never see the columns of two downloads
+        '''
+        rootname = self.get_rootname(symbol)
+        os.makedirs(os.path.dirname(rootname), exist_ok = True)
+        temp_root = f'{rootname}.{os.getpid()}'
+        for column in self.columns:
+            np.save(f'{temp_root}_{column}.tmp.npy', columns[column])
+        with open(temp_root + '.tmp.json', 'w', encoding='utf-8') as header_file:
+            json.dump(header, header_file)
+        with util.file_lock(rootname + '.lock'):
+            for column in self.columns:
+                os.replace(f'{temp_root}_{column}.tmp.npy', f'{rootname}_{column}.npy')
+            os.replace(temp_root + '.tmp.json', rootname + '.json')
+
+
+    def load(self, symbol, mmap_mode='r'):
+        '''
+        Returns the header & the dictionary of the (memory-mapped) columns of
+        symbol, None if it is not in the store or its files are inconsistent
+        '''
+        rootname = self.get_rootname(symbol)
+        if not os.path.isdir(os.path.dirname(rootname)):
+            return None
+        with util.file_lock(rootname + '.lock'):
+            header = self.read_header(symbol)
+            if header is None:
+                return None
+            try:
+                columns = {column: np.load(f'{rootname}_{column}.npy', mmap_mode=mmap_mode)
+                           for column in self.columns}
+            except FileNotFoundError:
+                return None
+        if any(values.shape[0] != header['n_rows'] for values in columns.values()):
+            return None
+        return header, columns
+
+
+    def get_security(self, symbol, period=None):
+        '''
+        Returns a StoredSecurity view of symbol over the days since the
+        download start of period (see finance.utilities.get_start),
+        the full history if None
+        '''
+        stored = self.load(symbol)
+        if stored is None:
+            raise ValueError(f'PriceStore: no consistent price history of {symbol}')
+        header, columns = stored
+        first = 0
+        if period is not None:
+            start = np.datetime64(util.get_start(period).strftime('%Y-%m-%d'), 'ns')
+            first = int(np.searchsorted(columns['dates'], start))
+        return StoredSecurity(symbol, header, columns, slice(first, None))
+
+
+class StoredSecurity():
+    '''
+    finance.security.Security substitute over the stored columns of a
+    symbol: provides what a Ticker is built from
+    '''
+    def __init__(self, symbol, header, columns, rows=slice(None)):
+        '''
+        header, columns -> output of PriceStore.load()
+        rows -> slice of the stored days in the view
+        '''
+        self._symbol  = symbol
+        self._header  = header
+        self._columns = columns
+        self._rows    = rows
+
+    def get_name(self):
+        '''Return the security name'''
+        return self._header['name']
+
+    def get_currency(self):
+        '''Return the security currency'''
+        return self._header['currency']
+
+    def get_close(self):
+        '''Return the Date & Close_symbol dataframe of the view'''
+        return self.get_market_data()[['Date', f'Close_{self._symbol}']]
+
+    def get_volume(self):
+        '''Return the Date & Vol_symbol dataframe of the view'''
+        return self.get_market_data()[['Date', f'Vol_{self._symbol}']]
+
+    def get_market_data(self):
+        '''Return the Date, Close_symbol & Vol_symbol dataframe of the view'''
+        return pd.DataFrame({'Date': self._columns['dates'][self._rows],
+                             f'Close_{self._symbol}': self._columns['close'][self._rows],
+                             f'Vol_{self._symbol}': self._columns['volume'][self._rows],
+                             })
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 14:05:21 2026
+
+scheduler.py
+
+Fans the securities of a portfolio out to a process pool:
+each worker downloads its security, builds its EMA map & best EMAs
+while the parent renders & recommends the securities already done,
+in portfolio order
+
+@author: charles mégnin
+"""
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from charting import trading as tra
+from charting import trading_defaults as dft
+from charting import topo_map as tpm
+from finance import utilities as util
+
+
+def prepare_security(symbol, strategic_pos, dates, refresh_yahoo, refresh_ema, n_workers=1,
+                     search_mode=dft.SEARCH_MODE, tile_mb=dft.TILE_MAX_MB):
+    '''
+    Download & CPU stage for a single security:
+    Yahoo download (or pickle load), EMA map and best EMAs
+    dates -> date range in string format
+    search_mode -> 'grid': best EMAs from the full EMA map
+                   'coarse': coarse-to-fine search of the best EMAs only,
+                             approximate: may miss the best EMA of the grid
+                   'tiled': best EMAs from the full EMA map built in tiles
+                            of tile_mb MB (see Topomap.build_tiled_map)
+    Returns the ticker object, the date range in datetime format & the topomap
+    '''
+    ticker_obj = tra.load_security(dirname = dft.DATA_DIR,
+                                   ticker  = symbol,
+                                   refresh = refresh_yahoo,
+                                   period  = dft.DEFAULT_PERIOD,
+                                   dates   = dates,
+                                   )
+
+    # Convert dates to datetime
+    date_range = util.get_date_range(ticker_obj.get_close(), dates[0], dates[1])
+
+    topomap = tpm.Topomap(symbol, date_range, strategic_pos)
+    if search_mode == 'coarse':
+        # Search & save best EMA results to file
+        topomap.search_best_emas(ticker_obj.get_close(), dft.N_MAXIMA_SAVE)
+        return ticker_obj, date_range, topomap
+    if search_mode == 'tiled':
+        topomap.build_tiled_map(ticker_obj.get_close(), dft.N_MAXIMA_SAVE, tile_mb, verbose=True)
+        return ticker_obj, date_range, topomap
+    if search_mode != 'grid':
+        raise ValueError(f'search mode {search_mode} should be in {dft.SEARCH_MODES}')
+
+    # Read EMA map values from file or compute if not saved
+    topomap.load_ema_map(ticker_object = ticker_obj,
+                         refresh       = refresh_ema,
+                         n_workers     = n_workers,
+                         )
+
+    # Build & save best EMA results to file
+    topomap.build_best_emas(dft.N_MAXIMA_SAVE)
+    return ticker_obj, date_range, topomap
+
+
+def prepare_panel(symbols, strategies, dates, refresh_yahoo, refresh_ema):
+    '''
+    Download stage of every security, then the EMA maps of all securities
+    in a single panel pass (see Topomap.load_panel_maps) & their best EMAs
+    Returns a list of (prepared, exception) in portfolio order where prepared
+    is the output of prepare_security() or None if it raised exception
+    '''
+    results, loaded = [None] * len(symbols), []
+    for i, symbol in enumerate(symbols):
+        try:
+            ticker_obj = tra.load_security(dirname = dft.DATA_DIR,
+                                           ticker  = symbol,
+                                           refresh = refresh_yahoo,
+                                           period  = dft.DEFAULT_PERIOD,
+                                           dates   = dates,
+                                           )
+            date_range = util.get_date_range(ticker_obj.get_close(), dates[0], dates[1])
+        except Exception as ex:
+            results[i] = (None, ex)
+        else:
+            loaded.append((i, ticker_obj, date_range))
+    if not loaded:
+        return results
+
+    try:
+        topomaps = tpm.Topomap.load_panel_maps(ticker_objects = [obj for _, obj, _ in loaded],
+                                               date_ranges    = [rng for _, _, rng in loaded],
+                                               positions      = [strategies[i] for i, _, _ in loaded],
+                                               refresh        = refresh_ema,
+                                               )
+    except Exception as ex:
+        for i, _, _ in loaded:
+            results[i] = (None, ex)
+        return results
+
+    for (i, ticker_obj, date_range), topomap in zip(loaded, topomaps):
+        try:
+            topomap.build_best_emas(dft.N_MAXIMA_SAVE)
+        except Exception as ex:
+            results[i] = (None, ex)
+        else:
+            results[i] = ((ticker_obj, date_range, topomap), None)
+    return results
+
+
+def schedule_securities(securities, dates, refresh_yahoo, refresh_ema,
+                        n_tickers=dft.N_TICKERS, n_workers=dft.N_WORKERS,
+                        search_mode=dft.SEARCH_MODE, tile_mb=dft.TILE_MAX_MB):
+    '''
+    Generator over the prepared securities in portfolio order
+    securities -> dataframe with Ticker & Strategy columns (see Holdings)
+    n_tickers  -> number of securities prepared concurrently, each in its own
+                  process. With n_tickers > 1 each map is built on a single
+                  process, otherwise on n_workers processes
+    search_mode, tile_mb -> see prepare_security(), 'panel': all EMA maps in a single
+                   panel pass before the first security is yielded (see prepare_panel)
+    yields (index, symbol, strategic position, prepared, exception) where
+    prepared is the output of prepare_security() or None if it raised exception
+    '''
+    symbols    = list(securities.Ticker)
+    strategies = [strategy.strip() for strategy in securities.Strategy]
+
+    if search_mode == 'panel':
+        results = prepare_panel(symbols, strategies, dates, refresh_yahoo, refresh_ema)
+        for i, (prepared, error) in enumerate(results):
+            yield i, symbols[i], strategies[i], prepared, error
+        return
+
+    if n_tickers <= 1: # prepare each security when it is requested
+        for i, (symbol, strategic_pos) in enumerate(zip(symbols, strategies)):
+            try:
+                prepared = prepare_security(symbol, strategic_pos, dates,
+                                            refresh_yahoo, refresh_ema, n_workers,
+                                            search_mode, tile_mb)
+            except Exception as ex:
+                yield i, symbol, strategic_pos, None, ex
+            else:
+                yield i, symbol, strategic_pos, prepared, None
+        return
+
+    with ProcessPoolExecutor(max_workers = n_tickers) as pool:
+        futures = [pool.submit(prepare_security, symbol, strategic_pos, dates,
+                               refresh_yahoo, refresh_ema, 1, search_mode, tile_mb)
+                   for symbol, strategic_pos in zip(symbols, strategies)
+                   ]
+        # collect in submission order so the output does not depend on scheduling
+        for i, future in enumerate(futures):
+            try:
+                prepared = future.result()
+            except Exception as ex:
+                yield i, symbols[i], strategies[i], None, ex
+            else:
+                yield i, symbols[i], strategies[i], prepared, None
+
+
+def print_exception(symbol, exception):
+    '''Print an exception raised while processing symbol with its traceback'''
+    print(f'Could not process {symbol}: Exception={exception}')
+    print(''.join(traceback.format_exception(type(exception),
+                                             exception,
+                                             exception.__traceback__,
+                                             )))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 22:31:07 2026
+
+strategies.py
+
+Strategy plugins of the Topomap grid engine. A strategy is made of
+- a signal generator: one mean per span (means) & the days on which a
+  signal may fire (sign_mask)
+- a position rule: 'hold' keeps the position of the last non-zero SIGN,
+  'band' is only invested while the SIGN is on the target side
+- a return/fee model: the broker's fee on the wealth of every buy & sell
+  and the execution lag, both Topomap settings
+All strategies are evaluated by topo_engine.GridScorer for blocks of
+buffers, so that a new strategy gets the batched grid evaluation, the
+EMA map cache & the process pool of Topomap.build_ema_map for free:
+    topomap.set_strategy(stg.SmaStrategy())
+    topomap.load_ema_map(ticker_object, refresh)
+
+@author: charles mégnin
+"""
+import hashlib
+import numpy as np
+
+from charting import trading_defaults as dft
+from charting import topo_engine as eng
+
+
+class Strategy():
+    '''
+    Base strategy: subclasses implement means()
+    name -> map family of the strategy (file names & plot titles)
+    rule -> position rule in topo_engine.RULES
+    incremental -> the terminal state of the map can be extended
+                   (Topomap.update_ema_map, EMAs only)
+    '''
+    name        = None
+    rule        = 'hold'
+    incremental = False
+
+    def means(self, close, spans):
+        '''
+        Means compared to the close with a buffer band, one per span
+        close -> 1D array over the date range / spans -> 1D array
+        Returns a (spans x days) array. Must be picklable for the process pool
+        '''
+        raise NotImplementedError(f'{type(self).__name__}.means()')
+
+    def sign_mask(self, close):
+        '''
+        Days on which a new SIGN may fire, the others keep the SIGN of the
+        day before. close -> Close series over the date range
+        Returns a 1D boolean array or None (every day)
+        '''
+        return None
+
+    def get_key(self):
+        '''Return the string identifying the strategy & its parameters (cache keys)'''
+        return self.name
+
+
+class EmaStrategy(Strategy):
+    '''Close vs EMA +/- buffer: the build_strategy() strategy'''
+    name        = 'ema'
+    incremental = True
+
+    def means(self, close, spans):
+        return eng.ema_matrix(close, spans)
+
+
+class SmaStrategy(Strategy):
+    '''Close vs SMA +/- buffer, no position before span days'''
+    name = 'sma'
+
+    def means(self, close, spans):
+        return eng.sma_matrix(close, spans)
+
+
+class BandStrategy(Strategy):
+    '''
+    Position rule of RecommendationSync._make_recommendation2: stay cash
+    within the buffer. The position is only invested while the close is
+    beyond the band of the mean on the side of the strategic position
+    '''
+    rule = 'band'
+
+    def __init__(self, base=None):
+        '''base -> strategy providing the means, EmaStrategy if None'''
+        self._base = EmaStrategy() if base is None else base
+        self.name  = f'{self._base.name}_band'
+
+    def means(self, close, spans):
+        return self._base.means(close, spans)
+
+    def sign_mask(self, close):
+        return self._base.sign_mask(close)
+
+    def get_key(self):
+        return f'{self._base.get_key()}|band'
+
+
+class VolumeFilter(Strategy):
+    '''
+    Volume filter of a strategy: a SIGN only fires on days when the volume
+    is at least factor x its mean over the preceding window days
+    '''
+    def __init__(self, volume, base=None, window=dft.VOLUME_WINDOW, factor=dft.VOLUME_FACTOR):
+        '''
+        volume -> Volume series with the dates of the Close series
+        base -> filtered strategy, EmaStrategy if None
+        '''
+        self._volume = volume
+        self._base   = EmaStrategy() if base is None else base
+        self._window = window
+        self._factor = factor
+        self.name = f'{self._base.name}_volume'
+        self.rule = self._base.rule
+
+    @classmethod
+    def from_ticker(cls, ticker_object, base=None, window=dft.VOLUME_WINDOW,
+                    factor=dft.VOLUME_FACTOR):
+        '''Volume filter from the volume context (see Ticker.get_volume_context)'''
+        return cls(ticker_object.get_volume_context().Volume, base, window, factor)
+
+    def means(self, close, spans):
+        return self._base.means(close, spans)
+
+    def sign_mask(self, close):
+        volume = self._volume.reindex(close.index).astype(np.float64)
+        level  = volume.rolling(self._window).mean().shift(1)
+        # no filter before a full window of volumes
+        mask = (volume >= self._factor * level) | level.isna()
+        base = self._base.sign_mask(close)
+        return mask.to_numpy() if base is None else mask.to_numpy() & base
+
+    def get_key(self):
+        digest = hashlib.sha256(self._volume.to_numpy(dtype=np.float64).tobytes()).hexdigest()
+        return f'{self._base.get_key()}|volume|{self._window}|{self._factor!r}|{digest}'
+
+
+def make_strategy(name, ticker_object=None):
+    '''
+    Strategy from its name in dft.MAP_STRATEGIES: mean type (ema/sma) followed
+    by an optional modifier (band rule or volume filter)
+    ticker_object -> Ticker providing the volume of the volume filter
+    '''
+    if name not in dft.MAP_STRATEGIES:
+        raise ValueError(f'make_strategy: strategy {name} should be in {dft.MAP_STRATEGIES}')
+    mean_type, _, modifier = name.partition('_')
+    base = EmaStrategy() if mean_type == 'ema' else SmaStrategy()
+    if modifier == 'band':
+        return BandStrategy(base)
+    if modifier == 'volume':
+        if ticker_object is None:
+            raise ValueError(f'make_strategy: strategy {name} needs a ticker volume')
+        return VolumeFilter.from_ticker(ticker_object, base)
+    return base
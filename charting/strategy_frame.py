@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 19:42:15 2026
+
+strategy_frame.py
+
+Compact EMA strategy: int8 sign/position/action codes instead of
+string columns, price columns in float64 or float32 and SMA & buffer
+columns computed only on request.
+to_frame() converts to the build_strategy() dataframe for plots
+
+@author: charles mégnin
+"""
+import numpy as np
+import pandas as pd
+
+from charting import trading_defaults as dft
+from charting import topo_engine as eng
+
+
+def _cumprod(values):
+    '''Cumulative product skipping NaN values as pandas does'''
+    products = np.nancumprod(values)
+    products[np.isnan(values)] = np.nan
+    return products
+
+
+class StrategyFrame():
+    '''
+    EMA strategy of a Close series for a given span & buffer
+    sign, position & action -> int8 codes (see topo_engine)
+    close, EMA, SMA & buffers -> dtype (float64 or float32)
+    returns & wealth -> float64
+    '''
+    def __init__(self, index, close, ema, span, buffer, strat_pos, init_wealth,
+                 lag=dft.LAG, dtype=np.float64):
+        '''
+        index -> dates of close
+        close, ema -> 1D arrays
+        '''
+        close = np.asarray(close, dtype=np.float64)
+        ema   = np.asarray(ema, dtype=np.float64)
+        self._index     = index
+        self._span      = span
+        self._buffer    = buffer
+        self._strat_pos = strat_pos
+        self._lag       = lag
+        self._dtype     = dtype
+
+        self._sign = eng.build_signs(close, ema, [buffer])[0]
+        self._position, self._action = eng.position_codes(self._sign, strat_pos)
+
+        # hold returns: the change of a missing close is taken from the last close
+        padded = pd.Series(close).ffill().to_numpy() if np.isnan(close).any() else close
+        self._ret = eng.daily_returns(padded, strat_pos)
+        self._cumret_hold = init_wealth * _cumprod(self._ret)
+        self._cumret_ema  = _cumprod(self.get_ema_returns()) * init_wealth
+        self._cumret_ema[0] = init_wealth
+
+        self._close = close.astype(dtype, copy=False)
+        self._ema   = ema.astype(dtype, copy=False)
+        self._sma   = None # computed on request
+
+
+    def get_index(self):
+        '''Return the dates of the strategy'''
+        return self._index
+
+    def get_positions(self):
+        '''Return the int8 position codes'''
+        return self._position
+
+    def get_actions(self):
+        '''Return the int8 action codes'''
+        return self._action
+
+    def get_ema(self):
+        '''Return the EMA'''
+        return self._ema
+
+    def get_sma(self):
+        '''Return the SMA, computed on the first request'''
+        if self._sma is None:
+            close = pd.Series(self._close.astype(np.float64))
+            self._sma = close.rolling(window=int(self._span)).mean().to_numpy(self._dtype)
+        return self._sma
+
+    def get_bands(self, mean_type):
+        '''Return the (minus, plus) buffer boundaries of the EMA or SMA'''
+        if mean_type == 'EMA':
+            mean = self._ema
+        elif mean_type == 'SMA':
+            mean = self.get_sma()
+        else:
+            raise ValueError(f'mean_type {mean_type} should be EMA or SMA')
+        return mean*(1 - self._buffer), mean*(1 + self._buffer)
+
+    def get_ema_returns(self):
+        '''
+        Daily returns of the EMA strategy: no change in cash.
+        Returns only accumulate after LAG days
+        '''
+        ret_ema = self._ret.copy()
+        lagged  = self._position[:self._position.shape[0] - self._lag]
+        ret_ema[self._lag:][lagged == eng.CASH] = 1.0
+        return ret_ema
+
+
+    def get_fee(self, fee_pct):
+        '''Return the fees of all buys & sells in currency'''
+        fee  = fee_pct * np.nansum(self._cumret_ema[self._action == eng.BUY])
+        fee += fee_pct * np.nansum(self._cumret_ema[self._action == eng.SELL])
+        return fee
+
+
+    def get_cumret(self, strategy, fee=0):
+        '''
+        Returns the relative difference between final and initial wealth
+        of the hold or of the EMA strategy net of fee
+        '''
+        if strategy.lower() == 'hold':
+            return self._cumret_hold[-1]/dft.INIT_WEALTH - 1
+        if strategy.lower() == 'ema':
+            return (self._cumret_ema[-1]-fee)/dft.INIT_WEALTH - 1
+        raise ValueError(f'option {strategy} should be either ema or hold')
+
+
+    def to_frame(self, d_frame=None):
+        '''
+        Returns the strategy in the build_strategy() dataframe layout:
+        Close, SMA_MINUS, EMA_MINUS, EMA, EMA_PLUS, SMA, SMA_PLUS, SIGN,
+        POSITION, ACTION, RET, CUMRET_HOLD, RET_EMA, CUMRET_EMA
+        d_frame -> dataframe with a Close column the columns are added to,
+                   a new dataframe if None
+        '''
+        if d_frame is None:
+            d_frame = pd.DataFrame({'Close': self._close}, index=self._index)
+        for mean_type, mean in [('EMA', self._ema), ('SMA', self.get_sma())]:
+            minus, plus = self.get_bands(mean_type)
+            d_frame.loc[:, mean_type] = mean
+            d_frame.insert(loc=1, column=f'{mean_type}_MINUS', value=minus)
+            d_frame.insert(loc=len(d_frame.columns), column=f'{mean_type}_PLUS', value=plus)
+        d_frame.loc[:, 'SIGN']        = self._sign.astype(np.int64)
+        d_frame.loc[:, 'POSITION']    = eng.decode_positions(self._position)
+        d_frame.loc[:, 'ACTION']      = eng.decode_actions(self._action)
+        d_frame.loc[:, 'RET']         = self._ret
+        d_frame.loc[:, 'CUMRET_HOLD'] = self._cumret_hold
+        d_frame.loc[:, 'RET_EMA']     = self.get_ema_returns()
+        d_frame.loc[:, 'CUMRET_EMA']  = self._cumret_ema
+        return d_frame
+
+
+    def get_row(self, row):
+        '''Returns a row of the strategy as a series, e.g. row=-1 for the last date'''
+        return self.to_frame().iloc[row]
@@ -0,0 +1,841 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 09:12:44 2026
+
+topo_engine.py
+
+Numpy kernels behind the Topomap EMA strategy
+Positions & actions are integer-coded as their index in
+dft.POSITIONS & dft.ACTIONS
+
+@author: charles mégnin
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+
+from charting import trading_defaults as dft
+
+# Integer codes
+LONG      = dft.POSITIONS.index('long')
+SHORT     = dft.POSITIONS.index('short')
+CASH      = dft.POSITIONS.index('cash')
+BUY       = dft.ACTIONS.index('buy')
+SELL      = dft.ACTIONS.index('sell')
+NO_CHANGE = dft.ACTIONS.index('n/c')
+
+# terminal state of the cells of a pass (see grid_pass)
+STATE_KEYS = ['sign', 'position', 'history', 'wealth', 'buys', 'sells']
+# statistics of the cells returned besides the EMA map (GridScorer stats)
+LAYER_KEYS = ['sharpe', 'drawdown', 'exposure', 'trades']
+# accumulators of the statistics carried by the terminal state (see stat_layers):
+# invested days, trades, wealth peak, lowest wealth/peak ratio & the sum and
+# sum of squares of the daily strategy returns
+STAT_KEYS = ['invested_days', 'trade_count', 'peak', 'trough', 'ret_sum', 'ret_sq']
+# position rules of GridScorer: hold -> position of the last non-zero SIGN
+# (build_positions), band -> invested only while SIGN is on the target side
+RULES = ['hold', 'band']
+
+
+def position_codes(signs, strat_pos, initial=CASH):
+    '''
+    Vectorized position/action state machine
+    signs -> -1/0/1 array, time along the last axis
+    strat_pos -> strategic position 'long' or 'short'
+    initial -> position code(s) on the first time step (cash by default)
+    Returns int8 position & action code arrays with the shape of signs
+
+    The position only changes when the sign changes to a non-zero value:
+    it is invested (long or short) when the last non-zero sign is 1 (long)
+    or -1 (short) and cash otherwise. A run of signs starting on the first
+    time step triggers no action and keeps the initial position.
+    '''
+    if strat_pos == 'long':
+        target, invested, enter, leave = 1, LONG, BUY, SELL
+    elif strat_pos == 'short':
+        target, invested, enter, leave = -1, SHORT, SELL, BUY
+    else:
+        raise ValueError(f'build_positions: "{strat_pos}" long or short positions only')
+
+    signs = np.asarray(signs)
+    # signs in the initial run never differ from their previous value
+    first_run = np.logical_and.accumulate(signs == signs[..., :1], axis=-1)
+    signs = np.where(first_run, 0, signs)
+
+    # index of the last non-zero sign (0 if none)
+    steps = np.arange(signs.shape[-1])
+    last  = np.where(signs != 0, steps, 0)
+    np.maximum.accumulate(last, axis=-1, out=last)
+    last_sign = np.take_along_axis(signs, last, axis=-1)
+
+    initial   = np.asarray(initial)[..., np.newaxis]
+    positions = np.where(last_sign == target,
+                         invested,
+                         np.where(last_sign == 0, initial, CASH)
+                         ).astype(np.int8)
+
+    actions = np.full(positions.shape, NO_CHANGE, dtype=np.int8)
+    moved   = positions[..., 1:] != positions[..., :-1]
+    actions[..., 1:][moved] = np.where(positions[..., 1:][moved] == invested, enter, leave)
+    return positions, actions
+
+
+def decode_positions(codes):
+    '''Returns the position strings corresponding to position codes'''
+    return np.asarray(dft.POSITIONS, dtype=object)[codes]
+
+
+def decode_actions(codes):
+    '''Returns the action strings corresponding to action codes'''
+    return np.asarray(dft.ACTIONS, dtype=object)[codes]
+
+
+def ema_matrix(close, spans, initial=None):
+    '''
+    Exponential moving averages of close for all spans in one recursive
+    filter over time, vectorized across spans
+    close -> (..., days) array / spans -> 1D array
+    initial -> (..., spans) EMAs on the day before close starts to continue
+               a previous filter, None to start from the first close
+    Returns a (..., spans, days) array identical to
+    pandas ewm(span=span, adjust=False).mean() for every span
+    NaN close values are skipped and decay the weights as in pandas
+    '''
+    close  = np.asarray(close, dtype=np.float64)
+    spans  = np.asarray(spans, dtype=np.float64)
+    com    = (spans - 1) / 2.0
+    alpha  = 1. / (1. + com)
+    factor = 1. - alpha
+
+    n_days = close.shape[-1]
+    emas   = np.empty(close.shape[:-1] + (spans.shape[0], n_days), dtype=np.float64)
+    if initial is None:
+        weighted = np.repeat(close[..., np.newaxis, 0], spans.shape[0], axis=-1)
+        emas[..., 0] = weighted
+        first = 1
+    else:
+        weighted = np.asarray(initial, dtype=np.float64)
+        first = 0
+
+    if not np.isnan(close).any():
+        for step in range(first, n_days):
+            cur = close[..., np.newaxis, step]
+            update = (factor * weighted + alpha * cur) / (factor + alpha)
+            # pandas skips the update when the mean equals the new value
+            weighted = np.where(weighted != cur, update, weighted)
+            emas[..., step] = weighted
+        return emas
+
+    old_wt = np.ones(weighted.shape, dtype=np.float64)
+    for step in range(first, n_days):
+        cur   = close[..., np.newaxis, step]
+        obs   = ~np.isnan(cur)
+        valid = ~np.isnan(weighted)
+        old_wt = np.where(valid, old_wt * factor, old_wt)
+        update = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        weighted = np.where(valid & obs & (weighted != cur), update, weighted)
+        old_wt   = np.where(valid & obs, 1., old_wt)
+        weighted = np.where(~valid & obs, cur, weighted)
+        emas[..., step] = weighted
+    return emas
+
+
+def sma_matrix(close, spans):
+    '''
+    Simple moving averages of close for all spans from a single cumulative
+    sum: each mean is a difference of two cumulative sums
+    close -> 1D array / spans -> 1D array of integer spans
+    Returns a (spans x days) array, NaN before span days & on windows with
+    a NaN close as pandas rolling(span).mean()
+    '''
+    close  = np.asarray(close, dtype=np.float64)
+    spans  = np.asarray(spans).astype(np.intp)
+    gaps   = np.isnan(close)
+    totals = np.concatenate([[0.], np.cumsum(np.where(gaps, 0., close))])
+    n_gaps = np.concatenate([[0], np.cumsum(gaps)])
+
+    smas = np.full((spans.shape[0], close.shape[0]), np.nan)
+    for i, span in enumerate(spans):
+        window = (totals[span:] - totals[:-span]) / span
+        window[n_gaps[span:] > n_gaps[:-span]] = np.nan
+        smas[i, span - 1:] = window
+    return smas
+
+
+def daily_returns(close, strat_pos):
+    '''
+    Returns 1 + daily % change of close (1 - daily % change for short positions)
+    as in the RET column of the strategy: first value is 1.0
+    '''
+    close  = np.asarray(close, dtype=np.float64)
+    change = close[..., 1:] / close[..., :-1] - 1
+    ret    = np.ones(close.shape, dtype=np.float64)
+    if strat_pos == 'long':
+        ret[..., 1:] = 1.0 + change
+    else: # short
+        ret[..., 1:] = 1.0 - change
+    return ret
+
+
+def hold_return(ret, init_wealth):
+    '''Cumulative return of a hold strategy from daily returns'''
+    return init_wealth * np.cumprod(ret, axis=-1)[..., -1] / dft.INIT_WEALTH - 1
+
+
+def build_signs(close, ema, buffers, flat_start=True):
+    '''
+    SIGN block for all buffers of a given EMA:
+    below buffer: -1 / within buffer: 0 / above buffer: 1
+    flat_start -> set the first sign to 0 as on the first day of a strategy
+    Returns an int8 (buffers x days) array
+    '''
+    buffers = np.asarray(buffers, dtype=np.float64)[:, np.newaxis]
+    signs   = np.where(close - ema*(1 + buffers) > 0,
+                       1,
+                       np.where(close - ema*(1 - buffers) < 0, -1, 0)
+                       ).astype(np.int8)
+    if flat_start:
+        signs[..., 0] = 0 # set first value to 0
+    return signs
+
+
+def grid_pass(close, ema, buffers, ret, strat_pos, init_wealth, lag=dft.LAG, state=None):
+    '''
+    Runs the EMA strategy of a single span for all buffers at once
+    close, ema, ret -> 1D arrays over the date range
+    state -> terminal state of a previous pass over the preceding dates to
+             continue from, None to start a new strategy on the first date
+    Returns the terminal state of the pass as a dictionary of arrays (buffers,):
+        sign     -> last SIGN
+        position -> last POSITION code
+        history  -> last lag POSITION codes (buffers, lag)
+        wealth   -> cumulative product of the strategy returns
+        buys, sells -> sums of CUMRET_EMA on buy / sell days (fee bases)
+    and, if a continued state carries them, the STAT_KEYS accumulators
+    A continued state matches a single pass up to the rounding of the fee bases
+    '''
+    signs = build_signs(close, ema, buffers, flat_start = state is None)
+    if state is None:
+        positions, actions = position_codes(signs, strat_pos)
+
+        # return: cash=no change. Return only accumulates after lag days
+        ret_ema = np.broadcast_to(ret, positions.shape).copy()
+        ret_ema[:, lag:][positions[:, :positions.shape[1] - lag] == CASH] = 1.0
+
+        wealth = np.cumprod(ret_ema, axis=1)
+        cumret = wealth * init_wealth
+        cumret[:, 0] = init_wealth
+
+        # fees on buys and sells, summed as pandas does on the filtered rows
+        buys  = np.array([row[action == BUY].sum() for row, action in zip(cumret, actions)])
+        sells = np.array([row[action == SELL].sum() for row, action in zip(cumret, actions)])
+        history = np.concatenate([np.full((signs.shape[0], lag), CASH, dtype=np.int8),
+                                  positions], axis=1)
+    else:
+        # prepend the last known day to carry the state machine over
+        signs_ext = np.concatenate([state['sign'][:, np.newaxis], signs], axis=1)
+        positions, actions = position_codes(signs_ext, strat_pos, state['position'])
+        positions, actions = positions[:, 1:], actions[:, 1:]
+
+        history = np.concatenate([state['history'], positions], axis=1)
+        ret_ema = np.where(history[:, :positions.shape[1]] == CASH, 1.0, ret)
+
+        wealth = np.cumprod(np.concatenate([state['wealth'][:, np.newaxis], ret_ema], axis=1),
+                            axis=1)[:, 1:]
+        cumret = wealth * init_wealth
+        buys  = state['buys'] + np.where(actions == BUY, cumret, 0.).sum(axis=1)
+        sells = state['sells'] + np.where(actions == SELL, cumret, 0.).sum(axis=1)
+
+    terminal = {'sign'    : signs[:, -1],
+                'position': positions[:, -1],
+                'history' : history[:, history.shape[1] - lag:],
+                'wealth'  : wealth[:, -1],
+                'buys'    : buys,
+                'sells'   : sells,
+                }
+    if (state is not None) and all(key in state for key in STAT_KEYS):
+        peaks  = np.maximum(np.maximum.accumulate(wealth, axis=1), state['peak'][:, np.newaxis])
+        excess = ret_ema - 1
+        terminal['invested_days'] = state['invested_days'] + np.count_nonzero(positions != CASH,
+                                                                              axis=1)
+        terminal['trade_count'] = state['trade_count'] + np.count_nonzero(actions != NO_CHANGE,
+                                                                          axis=1)
+        terminal['peak']    = peaks[:, -1]
+        terminal['trough']  = np.minimum(state['trough'], (wealth / peaks).min(axis=1))
+        terminal['ret_sum'] = state['ret_sum'] + excess.sum(axis=1)
+        terminal['ret_sq']  = state['ret_sq'] + np.square(excess).sum(axis=1)
+    return terminal
+
+
+def stat_layers(state, n_days):
+    '''
+    LAYER_KEYS statistics of the cells from the STAT_KEYS accumulators of
+    their terminal state over n_days (GridScorer stats up to rounding)
+    '''
+    n_rets = n_days - 1
+    mean   = state['ret_sum'] / n_rets
+    var    = np.maximum(state['ret_sq'] - state['ret_sum'] * mean, 0) / (n_rets - 1)
+    std    = np.sqrt(var)
+    sharpe = np.zeros(mean.shape)
+    np.divide(mean, std, out=sharpe, where=std > 0)
+    return {'sharpe'  : sharpe * np.sqrt(dft.TRADING_DAYS),
+            'drawdown': state['trough'] - 1,
+            'exposure': state['invested_days'] / n_days,
+            'trades'  : state['trade_count'],
+            }
+
+
+PATH_BYTES_PER_CELL = 32 # path_returns(): float64 wealth, int32 indices & bool masks
+
+def path_returns(close, ema, buffers, strat_pos, fee_pct, init_wealth, lag=dft.LAG):
+    '''
+    Evaluates the EMA strategy of a single span for a batch of price paths
+    and all buffers at once
+    close, ema -> (paths x days) arrays
+    Returns the (paths x buffers) cumulative EMA returns net of fees:
+    grid_pass() & net_returns() of every path with the fee bases summed in
+    one reduction
+    Memory: ~PATH_BYTES_PER_CELL bytes per path, buffer & day
+    '''
+    sign, _, enter_buys = POSITION_RULES[strat_pos]
+    close   = np.asarray(close, dtype=np.float64)[:, np.newaxis, :]
+    ema     = np.asarray(ema, dtype=np.float64)[:, np.newaxis, :]
+    buffers = np.asarray(buffers, dtype=np.float64)[:, np.newaxis]
+    n_days  = close.shape[-1]
+
+    # SIGN: 1 above buffer, -1 below buffer, 0 within (see build_signs)
+    wealth = ema * (1 + buffers)
+    above  = close > wealth
+    np.multiply(ema, 1 - buffers, out=wealth)
+    signs  = (close < wealth).astype(np.int8)
+    np.negative(signs, out=signs)
+    np.copyto(signs, 1, where=above)
+    signs[..., 0] = 0
+
+    # state machine (see position_codes): the position is invested iff the
+    # last target sign outside the initial run is more recent than the last
+    # opposite sign
+    first_run = np.equal(signs, signs[..., :1], out=above)
+    np.logical_and.accumulate(first_run, axis=-1, out=first_run)
+    np.copyto(signs, 0, where=first_run)
+    steps  = np.arange(n_days, dtype=np.int32)
+    target = np.where(signs == sign, steps, -1)
+    np.maximum.accumulate(target, axis=-1, out=target)
+    other  = np.where(signs == -sign, steps, -1)
+    np.maximum.accumulate(other, axis=-1, out=other)
+    invested = np.greater(target, other, out=above)
+    del signs, target, other
+
+    # return: cash=no change. Return only accumulates after lag days
+    wealth[...] = daily_returns(close, strat_pos)
+    np.copyto(wealth[..., lag:], 1.0, where=~invested[..., :n_days - lag])
+    np.cumprod(wealth, axis=-1, out=wealth)
+    final = wealth[..., -1].copy()
+    np.multiply(wealth, init_wealth, out=wealth)
+
+    entries = (wealth[..., 1:] * (invested[..., 1:] > invested[..., :-1])).sum(axis=-1)
+    exits   = (wealth[..., 1:] * (invested[..., 1:] < invested[..., :-1])).sum(axis=-1)
+    buys, sells = (entries, exits) if enter_buys else (exits, entries)
+    fee  = fee_pct * buys
+    fee += fee_pct * sells
+    return (final * init_wealth - fee)/dft.INIT_WEALTH - 1
+
+
+def path_grid(paths, spans, buffers, strat_pos, fee_pct, init_wealth, lag=dft.LAG):
+    '''
+    EMA maps of a chunk of price paths: EMAs of all spans in one recursive
+    filter over the chunk and path_returns() for each span
+    paths -> (paths x days) array
+    Returns the (paths x spans x buffers) EMA maps & the (paths,) hold returns
+    '''
+    paths   = np.asarray(paths, dtype=np.float64)
+    emas    = ema_matrix(paths, spans)
+    returns = np.empty((paths.shape[0], emas.shape[1], np.asarray(buffers).shape[0]))
+    for i in range(emas.shape[1]):
+        returns[:, i] = path_returns(paths, emas[:, i], buffers, strat_pos,
+                                     fee_pct, init_wealth, lag)
+    hold = hold_return(daily_returns(paths, strat_pos), init_wealth)
+    return returns, hold
+
+
+def panel_emas(closes, spans):
+    '''
+    EMAs of the rows of a panel of close series on a shared calendar, each
+    row over its own trading days: NaN days (holidays, listing gaps) hold
+    the close & the EMAs of the last trading day, days before the first
+    close hold its values
+    All rows are filtered at once on their left-aligned trading days
+    closes -> (tickers x days) array with at least one close per row
+    Returns the filled (tickers x days) closes & the (tickers x spans x days) EMAs
+    '''
+    closes = np.asarray(closes, dtype=np.float64)
+    valid  = ~np.isnan(closes)
+    counts = np.count_nonzero(valid, axis=1)
+    if not counts.all():
+        raise ValueError('panel_emas: every ticker needs at least one close')
+    # trading days first in calendar order, padded with the last close
+    order   = np.argsort(~valid, axis=1, kind='stable')
+    compact = np.take_along_axis(closes, order, axis=1)
+    pad     = np.arange(closes.shape[1]) >= counts[:, np.newaxis]
+    compact = np.where(pad, compact[np.arange(closes.shape[0]), counts - 1][:, np.newaxis],
+                       compact)
+    # calendar day -> last trading day on or before it (the first one before it)
+    days  = np.maximum(np.cumsum(valid, axis=1) - 1, 0)
+    emas  = ema_matrix(compact, spans)
+    return (np.take_along_axis(compact, days, axis=1),
+            np.take_along_axis(emas, days[:, np.newaxis, :], axis=2))
+
+
+def panel_grid(closes, spans, buffers, strat_pos, fee_pct, init_wealth, lag=dft.LAG,
+               max_mb=dft.PANEL_MAX_MB):
+    '''
+    EMA maps of a panel of close series on a shared calendar, all tickers of
+    a chunk evaluated at once by path_returns()
+    closes -> (tickers x days) array, NaN on the days a ticker does not trade
+    max_mb -> size of the path_returns() workspace of a chunk of tickers
+    A NaN day is a day without change: no return, no new SIGN & no trade,
+    so with lag 1 each map equals the map of the ticker's own trading days
+    (up to the rounding of the fee bases). Larger lags count calendar days
+    Returns the (tickers x spans x buffers) EMA maps & the (tickers,) hold returns
+    '''
+    closes  = np.asarray(closes, dtype=np.float64)
+    buffers = np.asarray(buffers, dtype=np.float64)
+    n_tickers, n_days = closes.shape
+    chunk   = max(1, int(max_mb * 2**20 // (PATH_BYTES_PER_CELL * buffers.shape[0] * n_days)))
+    returns = np.empty((n_tickers, np.asarray(spans).shape[0], buffers.shape[0]))
+    hold    = np.empty(n_tickers)
+    for start in range(0, n_tickers, chunk):
+        rows = slice(start, min(start + chunk, n_tickers))
+        filled, emas = panel_emas(closes[rows], spans)
+        for i in range(emas.shape[1]):
+            returns[rows, i] = path_returns(filled, emas[:, i], buffers, strat_pos,
+                                            fee_pct, init_wealth, lag)
+        hold[rows] = hold_return(daily_returns(filled, strat_pos), init_wealth)
+    return returns, hold
+
+
+# target sign, invested position code & whether entering the position is a buy
+POSITION_RULES = {'long' : (1, LONG, True),
+                  'short': (-1, SHORT, False),
+                  }
+
+
+GRID_BYTES_PER_CELL = 32 # GridScorer workspaces: float64 bounds & wealth, intp indices, int8 masks
+
+class GridScorer():
+    '''
+    Scores the EMA strategy of a close series for blocks of buffers into
+    preallocated (buffers x days) workspaces: besides the terminal state of
+    grid_pass() it returns the fee, number of trades & net return of each
+    cell and allocates nothing per cell
+    The SIGN array & the state machine steps that do not depend on the
+    strategic position are shared when both positions are scored
+    Results are identical to grid_pass() & net_returns()
+    '''
+    def __init__(self, close, strat_pos, fee_pct, init_wealth, n_buffers, lag=dft.LAG,
+                 stats=False, rule='hold', mask=None):
+        '''
+        close -> 1D array over the date range
+        strat_pos -> default strategic position of score()
+        n_buffers -> largest number of buffers scored at once
+        stats -> also return the LAYER_KEYS statistics of the cells
+        rule -> position rule in RULES
+        mask -> 1D boolean array of the days on which a new SIGN may fire,
+                other days keep the SIGN of the day before. None: every day
+        '''
+        if strat_pos not in POSITION_RULES:
+            raise ValueError(f'build_positions: "{strat_pos}" long or short positions only')
+        if rule not in RULES:
+            raise ValueError(f'GridScorer: position rule {rule} should be in {RULES}')
+        self._close       = np.asarray(close, dtype=np.float64)
+        self._rets        = {position: daily_returns(self._close, position)
+                             for position in POSITION_RULES}
+        self._strat_pos   = strat_pos
+        self._fee_pct     = fee_pct
+        self._init_wealth = init_wealth
+        self._lag         = lag
+        self._stats       = stats
+
+        n_days = self._close.shape[0]
+        shape  = (n_buffers, n_days)
+        self._n_buffers = n_buffers
+        self._bound   = np.empty(shape, dtype=np.float64)
+        self._wealth  = np.empty(shape, dtype=np.float64)
+        self._signs   = np.empty(shape, dtype=np.int8)
+        self._above   = np.empty(shape, dtype=bool)
+        self._flags   = np.empty(shape, dtype=bool)
+        self._target  = np.empty(shape, dtype=bool)
+        self._last    = np.empty(shape, dtype=np.intp)
+        self._steps   = np.arange(n_days)
+        self._offsets = (np.arange(n_buffers) * n_days)[:, np.newaxis]
+        self._enter   = np.empty((n_buffers, n_days - 1), dtype=bool)
+        self._leave   = np.empty((n_buffers, n_days - 1), dtype=bool)
+        self._row     = np.empty(n_days, dtype=np.float64)
+        self._last_sign = None # last SIGN of the cells of the last score
+        self._rule    = rule
+        self._carry   = None # day -> last day a SIGN may fire on or before it
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool).copy()
+            mask[0] = True
+            self._carry = np.maximum.accumulate(np.where(mask, self._steps, 0))
+
+    def get_returns(self, strat_pos=None):
+        '''Return the daily returns (RET) of the close series for strat_pos'''
+        return self._rets[self._strat_pos if strat_pos is None else strat_pos]
+
+    def _masked_sums(self, cumret, masks):
+        '''Per row sums of cumret on masked days, summed as pandas does on the filtered rows'''
+        sums = np.empty(masks.shape[0], dtype=np.float64)
+        for i, (row, mask) in enumerate(zip(cumret, masks)):
+            count = np.count_nonzero(mask)
+            sums[i] = np.compress(mask, row, out=self._row[:count]).sum()
+        return sums
+
+    def score(self, ema, buffers, signal=None):
+        '''
+        Scores the cells of a single EMA for all buffers
+        Returns a dictionary of arrays (buffers,): the grid_pass() terminal
+        state (STATE_KEYS) and
+        fees -> fee in currency / trades -> number of buys & sells /
+        returns -> cumulative EMA return net of fees (EMA map values)
+        '''
+        return self.score_positions(ema, buffers, [self._strat_pos], signal)[self._strat_pos]
+
+    def score_positions(self, ema, buffers, positions, signal=None):
+        '''
+        Scores the cells of a single EMA for all buffers & strategic positions
+        ema -> 1D mean or (buffers x days) means, one per row
+        signal -> 1D series compared to the bands of the means, the close if
+                  None (e.g. the fast mean of a crossover)
+        Returns a dictionary position -> score() dictionary
+        '''
+        buffers = np.asarray(buffers, dtype=np.float64)
+        n_rows  = buffers.shape[0]
+        if n_rows > self._n_buffers:
+            raise ValueError(f'GridScorer.score: {n_rows} buffers > {self._n_buffers}')
+        bound  = self._bound[:n_rows]
+        signs  = self._signs[:n_rows]
+        above  = self._above[:n_rows]
+        flags  = self._flags[:n_rows]
+        last   = self._last[:n_rows]
+        signal = self._close if signal is None else signal
+
+        # SIGN: 1 above buffer, -1 below buffer, 0 within (see build_signs)
+        np.multiply(ema, (1 + buffers)[:, np.newaxis], out=bound)
+        np.subtract(signal, bound, out=bound)
+        np.greater(bound, 0, out=above)
+        np.multiply(ema, (1 - buffers)[:, np.newaxis], out=bound)
+        np.subtract(signal, bound, out=bound)
+        np.less(bound, 0, out=flags)
+        np.copyto(signs, flags, casting='unsafe')
+        np.negative(signs, out=signs)
+        np.copyto(signs, 1, where=above)
+        signs[:, 0] = 0
+        if self._carry is not None:
+            signs[...] = signs[:, self._carry]
+        last_sign = signs[:, -1].copy()
+
+        # state machine (see position_codes): the position is invested iff
+        # the last non-zero sign outside the initial run is the target sign
+        # (band rule: iff the sign of the day is the target sign)
+        np.equal(signs, signs[:, :1], out=flags)
+        np.logical_and.accumulate(flags, axis=1, out=flags)
+        np.copyto(signs, 0, where=flags)
+        if self._rule == 'band':
+            np.copyto(last, self._steps)
+        else:
+            np.not_equal(signs, 0, out=flags)
+            np.multiply(flags, self._steps, out=last)
+            np.maximum.accumulate(last, axis=1, out=last)
+        np.add(last, self._offsets[:n_rows], out=last)
+
+        self._last_sign = last_sign
+        scores = {}
+        for position in positions:
+            scores[position] = self._score_position(position, n_rows)
+            scores[position]['sign'] = last_sign
+        return scores
+
+    def score_lags(self, ema, buffers, lags):
+        '''
+        Scores the cells of a single EMA for all buffers & execution lags:
+        signs & positions do not depend on the lag, only the strategy
+        returns & the fee bases are evaluated per lag
+        Returns a dictionary lag -> score() dictionary
+        '''
+        n_rows = np.asarray(buffers).shape[0]
+        self.score_positions(ema, buffers, [])
+        scores = {}
+        for lag in lags:
+            scores[lag] = self._score_position(self._strat_pos, n_rows, lag)
+            scores[lag]['sign'] = self._last_sign
+        return scores
+
+    def score_prefix(self, ema, buffers, log_wealth, traded):
+        '''
+        Prefix sums of the EMA strategy of a single EMA for all buffers, from
+        which the net return of a cell over any sub-period is O(1)
+        (see Topomap.window_map):
+        log_wealth -> (buffers x days) output: log(CUMRET_EMA / init_wealth)
+        traded -> (buffers x days) output: cumulated CUMRET_EMA of buy & sell days
+        The outputs may be strided views of a larger (memory-mapped) array
+        Returns the score() dictionary
+        '''
+        n_rows = np.asarray(buffers).shape[0]
+        self.score_positions(ema, buffers, [])
+        scores = self._score_position(self._strat_pos, n_rows)
+        scores['sign'] = self._last_sign
+        wealth = self._wealth[:n_rows]
+        trades = np.logical_or(self._enter[:n_rows], self._leave[:n_rows],
+                               out=self._enter[:n_rows])
+
+        # accumulate in float64 before the outputs are cast
+        work = self._bound[:n_rows]
+        work[:, 0] = 0.0
+        np.multiply(wealth[:, 1:], trades, out=work[:, 1:])
+        np.cumsum(work, axis=1, out=work)
+        np.copyto(traded, work, casting='same_kind')
+        np.divide(wealth, self._init_wealth, out=work)
+        np.log(work, out=work)
+        np.copyto(log_wealth, work, casting='same_kind')
+        return scores
+
+    def _score_position(self, strat_pos, n_rows, lag=None):
+        '''
+        Position dependent part of score_positions(): positions, returns & fees
+        from the shared signs & last non-zero sign indices
+        lag -> execution lag, the scorer's if None
+        '''
+        sign, invested_code, enter_buys = POSITION_RULES[strat_pos]
+        lag    = self._lag if lag is None else lag
+        signs  = self._signs[:n_rows]
+        target = self._target[:n_rows]
+        last   = self._last[:n_rows]
+        wealth = self._wealth[:n_rows]
+        enter  = self._enter[:n_rows]
+        leave  = self._leave[:n_rows]
+
+        np.equal(signs, sign, out=target)
+        invested = self._flags[:n_rows]
+        np.take(target.ravel(), last.ravel(), out=invested.ravel())
+        np.greater(invested[:, 1:], invested[:, :-1], out=enter)
+        np.less(invested[:, 1:], invested[:, :-1], out=leave)
+        trades = np.count_nonzero(enter, axis=1) + np.count_nonzero(leave, axis=1)
+        stats  = {}
+        if self._stats:
+            stats['exposure'] = np.count_nonzero(invested, axis=1) / invested.shape[1]
+
+        # return: cash=no change. Return only accumulates after lag days
+        np.copyto(wealth, self._rets[strat_pos])
+        cash = np.logical_not(invested, out=target)
+        np.copyto(wealth[:, lag:], 1.0, where=cash[:, :cash.shape[1] - lag])
+        if self._stats:
+            stats['sharpe'], stats['ret_sum'], stats['ret_sq'] = self._sharpe(wealth[:, 1:])
+            stats['invested_days'] = np.count_nonzero(invested, axis=1)
+            stats['trade_count']   = trades
+        np.cumprod(wealth, axis=1, out=wealth)
+        final = wealth[:, -1].copy()
+        if self._stats: # as the Drawdown column of utilities.drawdown()
+            peaks = np.maximum.accumulate(wealth, axis=1, out=self._bound[:n_rows])
+            stats['peak'] = peaks[:, -1].copy()
+            np.divide(wealth, peaks, out=peaks)
+            stats['trough']   = peaks.min(axis=1)
+            stats['drawdown'] = stats['trough'] - 1
+        np.multiply(wealth, self._init_wealth, out=wealth)
+        wealth[:, 0] = self._init_wealth
+        entries = self._masked_sums(wealth[:, 1:], enter)
+        exits   = self._masked_sums(wealth[:, 1:], leave)
+        buys, sells = (entries, exits) if enter_buys else (exits, entries)
+
+        history = np.where(invested[:, invested.shape[1] - lag:], invested_code, CASH)
+        if history.shape[1] < lag: # fewer days than lag
+            history = np.concatenate([np.full((n_rows, lag - history.shape[1]), CASH),
+                                      history], axis=1)
+        fees  = self._fee_pct * buys
+        fees += self._fee_pct * sells
+        return {'position': np.where(invested[:, -1], invested_code, CASH).astype(np.int8),
+                'history' : history.astype(np.int8),
+                'wealth'  : final,
+                'buys'    : buys,
+                'sells'   : sells,
+                'fees'    : fees,
+                'trades'  : trades,
+                'returns' : (final * self._init_wealth - fees)/dft.INIT_WEALTH - 1,
+                **stats,
+                }
+
+    def _sharpe(self, growth):
+        '''
+        Annualized Sharpe ratio (no risk-free rate) of (buffers x days) daily
+        growth factors, 0 for cells that never leave cash
+        Returns the Sharpe ratios, the sums & sums of squares of the returns
+        '''
+        returns = np.subtract(growth, 1, out=self._bound[:growth.shape[0], :growth.shape[1]])
+        mean = returns.mean(axis=1)
+        std  = returns.std(axis=1, ddof=1)
+        sharpe = np.zeros(mean.shape)
+        np.divide(mean, std, out=sharpe, where=std > 0)
+        ret_sum = returns.sum(axis=1)
+        ret_sq  = np.square(returns, out=returns).sum(axis=1)
+        return sharpe * np.sqrt(dft.TRADING_DAYS), ret_sum, ret_sq
+
+
+def net_returns(state, fee_pct, init_wealth):
+    '''
+    Cumulative EMA returns net of fees from the terminal state of grid_pass()
+    Same arithmetic as get_cumret(data, 'ema', get_fee(data, actions))
+    '''
+    fee  = fee_pct * state['buys']
+    fee += fee_pct * state['sells']
+    return (state['wealth'] * init_wealth - fee)/dft.INIT_WEALTH - 1
+
+
+def stack_states(states):
+    '''Stacks the grid_pass() states of several spans into (spans, buffers, ...) arrays'''
+    return {key: np.stack([state[key] for state in states]) for key in states[0]}
+
+
+def span_state(states, index):
+    '''State of a single span from stacked states'''
+    return {key: value[index] for key, value in states.items()}
+
+
+#######################
+### Parallel engine ###
+#######################
+_WORKER_DATA = {} # per-process copy of the data shipped by the pool initializer
+
+def _init_worker(data):
+    '''
+    Process pool initializer: receives the close series & run settings once
+    and allocates the scoring workspaces of the process
+    '''
+    _WORKER_DATA.clear()
+    _WORKER_DATA.update(data)
+    _WORKER_DATA['scorer'] = GridScorer(close       = data['close'],
+                                        strat_pos   = data['strat_pos'],
+                                        fee_pct     = data['fee_pct'],
+                                        init_wealth = data['init_wealth'],
+                                        n_buffers   = data['n_buffers'],
+                                        lag         = data['lag'],
+                                        stats       = data['stats'],
+                                        rule        = data['rule'],
+                                        mask        = data['mask'],
+                                        )
+
+
+def _span_block(spans, buffers):
+    '''
+    Worker task: EMAs (means of the strategy) of a block of spans and, for
+    each strategic position, the EMA map rows & terminal states of the cells
+    '''
+    data = _WORKER_DATA
+    if data['means'] is None:
+        emas = ema_matrix(data['close'], spans)
+    else:
+        emas = data['means'](data['close'], spans)
+    scores = [data['scorer'].score_positions(ema, buffers, data['positions']) for ema in emas]
+    blocks = {}
+    for position in data['positions']:
+        states = stack_states([score[position] for score in scores])
+        keys = STATE_KEYS + (LAYER_KEYS + STAT_KEYS if data['stats'] else [])
+        blocks[position] = (states['returns'], {key: states[key] for key in keys})
+    return emas, blocks
+
+
+def parallel_grid(close, spans, buffers, positions, fee_pct, init_wealth, n_workers, lag=dft.LAG,
+                  stats=False, means=None, rule='hold', mask=None):
+    '''
+    Evaluates the EMA maps of strategic positions with the span axis split
+    across a process pool. Blocks are reassembled in span order so the result
+    does not depend on the number of workers or on their scheduling
+    positions -> list of strategic positions evaluated in the same pass
+    stats -> add the LAYER_KEYS statistics & STAT_KEYS accumulators of the cells
+             to their states
+    means -> picklable means(close, spans) of a strategy, the EMAs if None
+    rule, mask -> see GridScorer
+    Returns a dictionary position -> (spans x buffers) EMA map, the
+    (spans x days) EMA matrix & a dictionary position -> stacked terminal
+    states of the cells
+    '''
+    close = np.asarray(close, dtype=np.float64)
+    data  = {'close'      : close,
+             'n_buffers'  : np.asarray(buffers).shape[0],
+             'strat_pos'  : positions[0],
+             'positions'  : list(positions),
+             'fee_pct'    : fee_pct,
+             'init_wealth': init_wealth,
+             'lag'        : lag,
+             'stats'      : stats,
+             'means'      : means,
+             'rule'       : rule,
+             'mask'       : mask,
+             }
+    # a few blocks per worker to balance the load
+    n_blocks = min(spans.shape[0], dft.BLOCKS_PER_WORKER * n_workers)
+    blocks   = np.array_split(np.asarray(spans), n_blocks)
+    with ProcessPoolExecutor(max_workers = n_workers,
+                             initializer = _init_worker,
+                             initargs    = (data,),
+                             ) as pool:
+        results = list(pool.map(_span_block, blocks, repeat(np.asarray(buffers))))
+    matrix = np.concatenate([result[0] for result in results])
+    emas, states = {}, {}
+    for position in positions:
+        emas[position] = np.concatenate([result[1][position][0] for result in results])
+        states[position] = {key: np.concatenate([result[1][position][1][key]
+                                                 for result in results])
+                            for key in results[0][1][position][1]}
+    return emas, matrix, states
+
+
+def _init_path_worker(data):
+    '''Process pool initializer of parallel_paths(): grid & run settings'''
+    _WORKER_DATA.clear()
+    _WORKER_DATA.update(data)
+
+
+def _path_chunk(paths):
+    '''
+    Worker task: path_grid() of a chunk of paths, reduced to the best excess
+    return over hold of each path & the excess of data['cell'] if not None
+    '''
+    data = _WORKER_DATA
+    returns, hold = path_grid(paths, data['spans'], data['buffers'], data['strat_pos'],
+                              data['fee_pct'], data['init_wealth'], data['lag'])
+    if data['cell'] is None:
+        return returns, hold
+    excess = returns - hold[:, np.newaxis, np.newaxis]
+    return excess.max(axis=(1, 2)), excess[:, data['cell'][0], data['cell'][1]]
+
+
+def parallel_paths(chunks, spans, buffers, strat_pos, fee_pct, init_wealth, n_workers,
+                   lag=dft.LAG, cell=None):
+    '''
+    Evaluates the EMA maps of chunks of price paths, across a process pool
+    if n_workers > 1. Results are returned in chunk order
+    chunks -> iterable of (paths x days) arrays
+    cell -> None: yields path_grid() of each chunk
+            (span, buffer) indices: yields the best excess return over hold
+            of each path & the excess return of cell, so that only two
+            floats per path leave the workers
+    '''
+    data = {'spans'      : np.asarray(spans),
+            'buffers'    : np.asarray(buffers, dtype=np.float64),
+            'strat_pos'  : strat_pos,
+            'fee_pct'    : fee_pct,
+            'init_wealth': init_wealth,
+            'lag'        : lag,
+            'cell'       : cell,
+            }
+    if n_workers <= 1:
+        _init_path_worker(data)
+        for paths in chunks:
+            yield _path_chunk(paths)
+        return
+    with ProcessPoolExecutor(max_workers = n_workers,
+                             initializer = _init_path_worker,
+                             initargs    = (data,),
+                             ) as pool:
+        yield from pool.map(_path_chunk, chunks)
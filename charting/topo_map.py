@@ -8,6 +8,9 @@ topo_map.py
 @author: charles mégnin
 """
 import os
+import json
+import hashlib
+import heapq
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
@@ -16,6 +19,10 @@ from tqdm import tqdm
 
 from charting import trading_defaults as dft
 from charting import trading_plots as trplt
+from charting import topo_engine as eng
+from charting import ema_cache as emc
+from charting import strategy_frame as sfr
+from charting import strategies as stg
 from finance import utilities as util
 
 class Topomap():
@@ -36,13 +43,29 @@ class Topomap():
         self._strat_pos  = strategic_position.lower()
         self._fee        = dft.FEE_PCT
         self._init_wealth = dft.INIT_WEALTH
-        self._strategy   = None
         self._spans      = None
         self._buffers    = None
         self._emas       = None
         self._hold       = None
+        self._ema_matrix = None # (spans x days) EMAs shared by all strategies
+        self._ema_index  = None # dates of the EMA matrix
+        self._state      = None # terminal state of the EMA map cells
         self._best_emas  = None
         self._n_best     = None # number of best_emas
+        self._n_evaluated = None # cells evaluated by the last map or search
+        self._layers     = None # statistics of the cells by layer (see get_layer)
+        self._family     = 'ema' # strategy family of the map (see dft.MAP_FAMILIES)
+        self._cross_buffer = None # buffer of a crossover map
+        self._strategy   = stg.EmaStrategy() # strategy plugin of the grid engine
+        self._strategy_frame = None # StrategyFrame of the last build_strategy()
+        self._cube       = None # (spans x buffers x fees x lags) EMA map cube
+        self._cube_fees  = None
+        self._cube_lags  = None
+        self._prefix     = None # (days x 2 x spans x buffers) prefix index
+        self._prefix_index = None # dates of the prefix index
+        self._prefix_hold  = None # hold wealth of the prefix index
+        self._robust     = None # bootstrap robustness maps
+        self._significance = None # reality check of the best EMA
         self._ctr_plot_pathname = None
         self._sfc_plot_pathname = None
 
@@ -55,6 +78,10 @@ class Topomap():
         '''Reset spans'''
         self._spans  = spans
 
+    def set_emas(self, emas):
+        '''Reset the (spans x buffers) EMA map'''
+        self._emas = emas
+
     def set_date_range(self, date_range):
         '''Reset date range'''
         self._date_range = date_range
@@ -102,6 +129,47 @@ class Topomap():
         '''Return hold'''
         return self._hold
 
+    def get_fee_pct(self):
+        '''Return broker's fee'''
+        return self._fee
+
+    def get_layer(self, layer):
+        '''
+        Return a (spans x buffers) layer of the map:
+        'ema' -> EMA map of net returns
+        others -> statistic of the cells computed with the map (see dft.MAP_LAYERS)
+        '''
+        if layer == 'ema':
+            return self._emas
+        if layer not in dft.MAP_LAYERS:
+            raise ValueError(f'layer {layer} should be in {list(dft.MAP_LAYERS)}')
+        if (self._layers is None) or (layer not in self._layers):
+            raise ValueError(f'layer {layer} is only built with the EMA map by the grid engine')
+        return self._layers[layer]
+
+    def set_strategy(self, strategy):
+        '''
+        Sets the strategy plugin (see strategies) evaluated by the grid engine
+        of build_ema_map: its maps are saved & cached under the strategy name
+        '''
+        self._strategy = strategy
+        self._family   = strategy.name
+
+    def get_strategy(self):
+        '''Return the strategy plugin of the grid engine'''
+        return self._strategy
+
+    def get_family(self):
+        '''
+        Return the strategy family of the map: 'ema' & 'sma' maps are
+        span x buffer, 'crossover' maps fast span x slow span
+        '''
+        return self._family
+
+    def get_ema_matrix(self):
+        '''Return the (spans x days) EMA matrix'''
+        return self._ema_matrix
+
     def self_describe(self):
         '''Display all variables in class'''
         print(self.__dict__)
@@ -110,6 +178,14 @@ class Topomap():
         '''Return best emas dataframe '''
         return self._best_emas
 
+    def get_n_evaluated(self):
+        '''Return the number of cells evaluated by the last map or search'''
+        return self._n_evaluated
+
+    def is_partial_map(self):
+        '''True if the EMA map comes from a search: cells not evaluated are NaN'''
+        return bool(np.isnan(self._emas).any())
+
     def get_global_max(self):
         '''Returns the top span, buffer, ema, hold combination'''
         return self._best_emas.iloc[0]
@@ -124,55 +200,1023 @@ class Topomap():
         raise AssertionError(msg)
 
 
-    def build_ema_map(self, close, dates):
-        '''
-        Builds a 2D numpy array of EMAs as a function of span and buffer
-        This function iteratively calls build_strategy()
-        '''
+    @staticmethod
+    def get_default_grid():
+        '''Returns the spans & buffers of the map defined in the defaults file'''
         # define rolling window span range
         span_par = dft.get_spans()
-        self._spans = np.arange(span_par['min'],
-                                span_par['max'] + 1,
-                                step = 1
-                                )
+        spans = np.arange(span_par['min'],
+                          span_par['max'] + 1,
+                          step = 1
+                          )
 
         # define buffer range
         buff_par = dft.get_buffers()
-        self._buffers = np.linspace(buff_par['min'],
-                                    buff_par['max'],
-                                    buff_par['number'],
-                                    )
+        buffers = np.linspace(buff_par['min'],
+                              buff_par['max'],
+                              buff_par['number'],
+                              )
+        return spans, buffers
+
+
+    def build_ema_map(self, close, dates, engine=dft.MAP_ENGINE, n_workers=dft.N_WORKERS,
+                      others=()):
+        '''
+        Builds a 2D numpy array of EMAs as a function of span and buffer
+        engine = 'grid': computes each EMA once per span and evaluates
+                 all buffers at once (see topo_engine)
+        engine = 'strategy': iteratively calls build_strategy()
+        n_workers > 1 splits the spans of the grid engine across a process pool
+        others -> Topomaps of the other strategic positions of the same
+                  ticker & dates: the grid engine builds their maps in the
+                  same pass, sharing EMAs & SIGN arrays (see build_ema_maps)
+        The grid engine evaluates the strategy plugin of the map (see
+        set_strategy), shared by others, the strategy engine EMAs only
+        '''
+        if (engine == 'strategy') and (self._strategy.name != 'ema'):
+            msg = f'build_ema_map: engine {engine} only evaluates the ema strategy'
+            raise ValueError(msg)
+        for topomap in [self, *others]:
+            topomap._spans, topomap._buffers = self.get_default_grid()
+            topomap._state  = None
+            topomap._layers = None
+            topomap.set_strategy(self._strategy)
+
+        if engine == 'grid':
+            maps = self._build_grid_map(close.loc[dates[0]:dates[1], 'Close'], n_workers, others)
+        elif engine == 'strategy':
+            maps = {self._strat_pos: self._build_strategy_map(close.loc[dates[0]:dates[1], :])}
+            for topomap in others:
+                topomap.build_ema_map(close, dates, engine, n_workers)
+        else:
+            msg = f'build_ema_map: engine {engine} should be in {dft.MAP_ENGINES}'
+            raise ValueError(msg)
+
+        for topomap in [self, *others]:
+            if topomap._strat_pos in maps:
+                emas, hold = maps[topomap._strat_pos]
+                topomap._emas = emas
+                topomap.set_hold(hold)
+                topomap._n_evaluated = emas.size
+
+
+    def _build_grid_map(self, close, n_workers=1, others=()):
+        '''
+        Batched EMA map: the hold return is computed once per map, the EMA
+        once per span and all buffers are evaluated as a (buffers x days) block
+        The maps of others (Topomaps of other strategic positions) share the
+        EMAs, SIGN arrays & the position independent state machine steps
+        Returns a dictionary strategic position -> (EMA map, hold)
+        '''
+        span_par  = dft.get_spans()
+        topomaps  = [self, *others]
+        positions = [topomap.get_strategic_position() for topomap in topomaps]
+        values = close.to_numpy(dtype=np.float64)
+        strategy = self._strategy
+        mask     = strategy.sign_mask(close)
+        scorer   = self.get_scorer(values, stats = dft.MAP_STATS, mask = mask,
+                                   rule = strategy.rule)
+
+        if n_workers > 1:
+            print(f'Building ema map /{span_par["max"] - span_par["min"] + 1} '
+                  f'on {n_workers} processes')
+            emas, self._ema_matrix, states = eng.parallel_grid(close       = values,
+                                                               spans       = self._spans,
+                                                               buffers     = self._buffers,
+                                                               positions   = positions,
+                                                               fee_pct     = self._fee,
+                                                               init_wealth = self._init_wealth,
+                                                               n_workers   = n_workers,
+                                                               stats       = dft.MAP_STATS,
+                                                               means       = strategy.means,
+                                                               rule        = strategy.rule,
+                                                               mask        = mask,
+                                                               )
+            self._ema_index = close.index
+        else:
+            if strategy.incremental:
+                self.build_ema_matrix(close)
+            else:
+                self._ema_matrix = strategy.means(values, self._spans)
+            scores = []
+            desc = f'Building {strategy.name} map /{span_par["max"] - span_par["min"] + 1}'
+            for i, _ in tqdm(enumerate(self._spans), desc = desc, ncols=40):
+                scores.append(scorer.score_positions(self._ema_matrix[i], self._buffers,
+                                                     positions))
+            emas, states = {}, {}
+            for position in positions:
+                stacked = eng.stack_states([score[position] for score in scores])
+                emas[position]   = stacked['returns']
+                states[position] = {key: stacked[key] for key in stacked
+                                    if key in eng.STATE_KEYS + eng.LAYER_KEYS + eng.STAT_KEYS}
+
+        means = self._ema_matrix
+        if not strategy.incremental: # the EMA matrix only holds EMAs (see _lookup_ema)
+            self._ema_matrix = None
+        maps = {}
+        for topomap in topomaps:
+            position = topomap.get_strategic_position()
+            ret = scorer.get_returns(position)
+            topomap._ema_matrix = self._ema_matrix
+            topomap._ema_index  = self._ema_index
+            # keep the terminal state of every cell to extend the map later,
+            # with the accumulators of the statistics (see eng.stat_layers)
+            state = states[position]
+            if dft.MAP_STATS:
+                topomap._layers = {key: state.pop(key) for key in eng.LAYER_KEYS}
+            else:
+                state.pop('trades', None)
+            if strategy.incremental:
+                state['ema']   = means[:, -1]
+                state['close'] = values[-1]
+                state['hold_wealth'] = np.cumprod(ret)[-1]
+                topomap._state = topomap._stamp_state(state, close)
+            maps[position] = (emas[position], eng.hold_return(ret, self._init_wealth))
+        return maps
+
+
+    def build_sma_map(self, close):
+        '''
+        Map of the price vs simple moving average strategy as a function of
+        span and buffer: the EMA map with the SMAs of build_moving_average()
+        as means, all computed from a single cumulative sum
+        No position is taken before the first SMA (span days)
+        close -> Close dataframe
+        '''
+        self._spans, self._buffers = self.get_default_grid()
+        close  = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        values = close.to_numpy(dtype=np.float64)
+        scorer = self.get_scorer(values, stats = dft.MAP_STATS)
+        span_par = dft.get_spans()
+        desc = f'Building sma map /{span_par["max"] - span_par["min"] + 1}'
+        scores = [scorer.score(sma, self._buffers)
+                  for sma in tqdm(eng.sma_matrix(values, self._spans), desc = desc, ncols=40)]
+        scores = eng.stack_states(scores)
+        self._set_family_map('sma', scores['returns'],
+                             {key: scores[key] for key in eng.LAYER_KEYS}, scorer)
+
+
+    def build_crossover_map(self, close, buffer=dft.CROSSOVER_BUFFER,
+                            mean_type=dft.CROSSOVER_MEAN):
+        '''
+        Map of the fast/slow moving average crossover strategy as a function
+        of the fast span (rows) and the slow span (columns, in place of the
+        buffers): long when the fast mean is above the slow mean by more than
+        buffer, cash (or short) when it is below by more than buffer
+        The means of all spans are computed once & each fast span scores
+        all its slower spans as a single block. Cells with a slow span not
+        above the fast span are NaN
+        close -> Close dataframe
+        mean_type -> 'EMA' or 'SMA'
+        '''
+        spans  = self.get_default_grid()[0]
+        close  = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        values = close.to_numpy(dtype=np.float64)
+        if mean_type == 'EMA':
+            means = eng.ema_matrix(values, spans)
+        elif mean_type == 'SMA':
+            means = eng.sma_matrix(values, spans)
+        else:
+            raise ValueError(f'build_crossover_map: mean_type {mean_type} should be EMA or SMA')
+
+        n_spans = spans.shape[0]
+        scorer  = self.get_scorer(values, n_spans, stats = dft.MAP_STATS)
+        emas    = np.full((n_spans, n_spans), np.nan)
+        layers  = {key: np.full((n_spans, n_spans), np.nan) for key in eng.LAYER_KEYS}
+        desc = f'Building crossover map /{n_spans}'
+        for i in tqdm(range(n_spans - 1), desc = desc, ncols=40):
+            slow  = slice(i + 1, n_spans)
+            score = scorer.score(means[slow], np.full(n_spans - i - 1, buffer), signal = means[i])
+            emas[i, slow] = score['returns']
+            for key in layers:
+                if key in score:
+                    layers[key][i, slow] = score[key]
+
+        self._spans   = spans
+        self._buffers = spans
+        self._cross_buffer = buffer
+        self._set_family_map('crossover', emas, layers, scorer)
+
+
+    def _set_family_map(self, family, emas, layers, scorer):
+        '''Sets the map, layers & hold of a strategy family other than ema'''
+        self._family = family
+        self._emas   = emas
+        self._layers = layers if dft.MAP_STATS else None
+        self._state  = None # only EMA maps are extended
+        self._n_evaluated = int(np.count_nonzero(~np.isnan(emas)))
+        self.set_hold(eng.hold_return(scorer.get_returns(), self._init_wealth))
+
+
+    def build_tiled_map(self, close, n_best=dft.N_MAXIMA_SAVE, max_mb=dft.TILE_MAX_MB,
+                        verbose=False):
+        '''
+        EMA map of large grids in tiles of spans x buffers sized to max_mb:
+        the EMAs of a block of spans & the GridScorer workspace of a block of
+        buffers. The map is written tile by tile to its memory-mapped npy
+        file (see save_emas) & the best EMAs are streamed through a heap,
+        ranked as build_best_emas() ranks them
+        Tiled maps have no statistics layers & no terminal state to extend
+        close -> Close dataframe
+        Returns the peak resident memory of the process in MB
+        '''
+        spans, buffers = self.get_default_grid()
+        close  = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        values = close.to_numpy(dtype=np.float64)
+        n_days = values.shape[0]
+
+        # half of the budget for the scorer workspace, the rest for the EMAs
+        budget = max_mb * 2**20
+        buffer_tile = int(min(buffers.shape[0],
+                              max(1, budget // 2 // (eng.GRID_BYTES_PER_CELL * n_days))))
+        span_tile   = int(min(spans.shape[0],
+                              max(1, (budget - eng.GRID_BYTES_PER_CELL * n_days * buffer_tile)
+                                  // (8 * n_days))))
+        scorer = self.get_scorer(values, buffer_tile)
+
+        data_dir = os.path.join(dft.DATA_DIR, self._name)
+        os.makedirs(data_dir, exist_ok = True)
+        rootname = os.path.join(data_dir, self.get_ema_map_filename())
+        emas = np.lib.format.open_memmap(rootname + '.tmp.npy', mode='w+', dtype=np.float64,
+                                         shape=(spans.shape[0], buffers.shape[0]))
+        best = [] # heap of the n_best (value, -flat index) cells
+        n_tiles = -(-spans.shape[0] // span_tile) * -(-buffers.shape[0] // buffer_tile)
+        if verbose:
+            print(f'{self._name}: {n_tiles} tiles of {span_tile} spans x {buffer_tile} buffers')
+        with tqdm(total = n_tiles, desc = f'Building tiled map /{n_tiles}', ncols=40) as pbar:
+            for s_0 in range(0, spans.shape[0], span_tile):
+                block = eng.ema_matrix(values, spans[s_0:s_0 + span_tile])
+                for b_0 in range(0, buffers.shape[0], buffer_tile):
+                    cols = slice(b_0, b_0 + buffer_tile)
+                    tile = np.stack([scorer.score(ema, buffers[cols])['returns']
+                                     for ema in block])
+                    emas[s_0:s_0 + tile.shape[0], cols] = tile
+                    flat = (np.arange(s_0, s_0 + tile.shape[0])[:, np.newaxis] * buffers.shape[0]
+                            + np.arange(b_0, b_0 + tile.shape[1]))
+                    # only the cells at or above the tile's n_best-th value can enter the heap
+                    kth  = min(n_best, tile.size)
+                    keep = tile >= np.partition(tile.ravel(), -kth)[-kth]
+                    for value, index in zip(tile[keep], flat[keep]):
+                        if len(best) < n_best:
+                            heapq.heappush(best, (value, -index))
+                        elif (value, -index) > best[0]:
+                            heapq.heapreplace(best, (value, -index))
+                    pbar.update()
+        emas.flush()
+        del emas
+        os.replace(rootname + '.tmp.npy', rootname + '.npy')
+
+        self._spans, self._buffers = spans, buffers
+        self._state  = None
+        self._layers = None
+        self._family = 'ema'
+        self._n_evaluated = spans.shape[0] * buffers.shape[0]
+        self.set_hold(eng.hold_return(scorer.get_returns(), self._init_wealth))
+        self._save_map_header(rootname)
+        self._emas = np.load(rootname + '.npy', mmap_mode='r')
+
+        cells = [divmod(-index, buffers.shape[0]) for _, index in sorted(best, reverse=True)]
+        self._n_best = n_best
+        self._best_emas = pd.DataFrame({'span'  : [spans[i] for i, _ in cells],
+                                        'buffer': [buffers[j] for _, j in cells],
+                                        'ema'   : [self._emas[i, j] for i, j in cells],
+                                        'hold'  : self._hold,
+                                        }, dtype=np.float64)
+        self.save_best_emas()
+        peak = util.peak_rss()
+        if verbose and peak is not None:
+            print(f'{self._name}: peak resident memory {peak:.0f} MB')
+        return peak
+
+
+    def build_ema_cube(self, close, fees=None, lags=None):
+        '''
+        EMA map for several broker's fees & execution lags from a single
+        evaluation of the trade events of each cell: positions do not depend
+        on the lag & fees are linear in the wealth on buy & sell days
+        close -> Close dataframe
+        fees, lags -> levels of the cube, dft.CUBE_FEES & dft.CUBE_LAGS if None
+        Returns the (spans x buffers x fees x lags) cube of cumulative
+        returns net of fees
+        '''
+        fees = np.asarray(dft.CUBE_FEES if fees is None else fees, dtype=np.float64)
+        lags = [int(lag) for lag in (dft.CUBE_LAGS if lags is None else lags)]
+        self._spans, self._buffers = self.get_default_grid()
+
+        close  = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        values = close.to_numpy(dtype=np.float64)
+        scorer = self.get_scorer(values)
+        self.build_ema_matrix(close)
+
+        shape  = (self._spans.shape[0], self._buffers.shape[0], len(lags))
+        wealth = np.empty(shape)
+        buys   = np.empty(shape)
+        sells  = np.empty(shape)
+        span_par = dft.get_spans()
+        desc = f'Building ema cube /{span_par["max"] - span_par["min"] + 1}'
+        for i, ema in tqdm(enumerate(self._ema_matrix), desc = desc, ncols=40):
+            scores = scorer.score_lags(ema, self._buffers, lags)
+            for k, lag in enumerate(lags):
+                wealth[i, :, k] = scores[lag]['wealth']
+                buys[i, :, k]   = scores[lag]['buys']
+                sells[i, :, k]  = scores[lag]['sells']
+
+        # same arithmetic as net_returns() for every fee level
+        fee  = fees[:, np.newaxis] * buys[:, :, np.newaxis, :]
+        fee += fees[:, np.newaxis] * sells[:, :, np.newaxis, :]
+        self._cube = (wealth[:, :, np.newaxis, :] * self._init_wealth - fee)/dft.INIT_WEALTH - 1
+        self._cube_fees = fees
+        self._cube_lags = np.array(lags)
+        self.set_hold(eng.hold_return(scorer.get_returns(), self._init_wealth))
+        return self._cube
+
+
+    def get_cube(self):
+        '''Return the EMA map cube, its fee levels & its lags'''
+        return self._cube, self._cube_fees, self._cube_lags
+
+
+    def get_cube_slice(self, fee=None, lag=None):
+        '''
+        Return the (spans x buffers) EMA map of the cube for a fee level
+        & an execution lag (the topomap's fee & dft.LAG if None)
+        '''
+        fee = self._fee if fee is None else fee
+        lag = dft.LAG if lag is None else lag
+        if self._cube is None:
+            raise ValueError('get_cube_slice: build_ema_cube() first')
+        i_fee = self._grid_index(self._cube_fees, [fee])[0]
+        i_lag = self._grid_index(self._cube_lags, [lag])[0]
+        if i_fee < 0 or i_lag < 0:
+            msg  = f'get_cube_slice: fee {fee} should be in {self._cube_fees.tolist()} '
+            msg += f'and lag {lag} in {self._cube_lags.tolist()}'
+            raise ValueError(msg)
+        return self._cube[:, :, i_fee, i_lag]
+
+
+    def build_prefix_index(self, close, dtype=dft.PREFIX_DTYPE, save=True):
+        '''
+        Prefix index of the EMA map: cumulative log-wealth & cumulated wealth
+        traded on buy & sell days of every cell & day, from which window_map()
+        returns the map of any sub-period of the date range in O(1) per cell
+        The index does not depend on the broker's fee
+        close -> Close dataframe
+        dtype -> float type of the index: float32 halves its size
+        save -> write the index to a memory-mapped .npy file & a json header
+        Returns the (days x 2 x spans x buffers) index
+        '''
+        self._spans, self._buffers = self.get_default_grid()
+        close  = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        values = close.to_numpy(dtype=np.float64)
+        scorer = self.get_scorer(values)
+        self.build_ema_matrix(close)
+
+        shape = (values.shape[0], 2, self._spans.shape[0], self._buffers.shape[0])
+        if save:
+            rootname = self.get_prefix_rootname()
+            os.makedirs(os.path.dirname(rootname), exist_ok = True)
+            # write to a new file: the current one may be memory-mapped
+            prefix = np.lib.format.open_memmap(rootname + '.tmp.npy', mode='w+',
+                                               dtype=dtype, shape=shape)
+        else:
+            prefix = np.empty(shape, dtype=dtype)
+        span_par = dft.get_spans()
+        desc = f'Building prefix index /{span_par["max"] - span_par["min"] + 1}'
+        for i, ema in tqdm(enumerate(self._ema_matrix), desc = desc, ncols=40):
+            scorer.score_prefix(ema, self._buffers, prefix[:, 0, i].T, prefix[:, 1, i].T)
+
+        self._prefix_index = close.index
+        self._prefix_hold  = np.cumprod(scorer.get_returns())
+        if save:
+            prefix.flush()
+            del prefix
+            os.replace(rootname + '.tmp.npy', rootname + '.npy')
+            header = {'ticker'     : self._name,
+                      'position'   : self._strat_pos,
+                      'dates'      : self._prefix_index.strftime('%Y-%m-%d').tolist(),
+                      'spans'      : self._spans.tolist(),
+                      'buffers'    : self._buffers.tolist(),
+                      'lag'        : dft.LAG,
+                      'init_wealth': self._init_wealth,
+                      'hold_wealth': self._prefix_hold.tolist(),
+                      'digest'     : self._close_digest(close),
+                      }
+            with open(rootname + '.json', 'w', encoding='utf-8') as header_file:
+                json.dump(header, header_file)
+            self._prefix = np.load(rootname + '.npy', mmap_mode='r')
+        else:
+            self._prefix = prefix
+        return self._prefix
+
+
+    def load_prefix_index(self, close, mmap_mode='r'):
+        '''
+        Load the prefix index from file (memory-mapped by default)
+        close -> Close dataframe the index must have been built from
+        Returns False if there is none or if it was built with a different
+        grid, different run parameters or a different price history (e.g.
+        dividend/split adjustment)
+        '''
+        rootname = self.get_prefix_rootname()
+        if not os.path.exists(rootname + '.npy'):
+            return False
+        with open(rootname + '.json', 'r', encoding='utf-8') as header_file:
+            header = json.load(header_file)
+
+        spans, buffers = self.get_default_grid()
+        if not (np.array_equal(header['spans'], spans)
+                and np.array_equal(header['buffers'], buffers)
+                and header['lag'] == dft.LAG
+                and header['init_wealth'] == self._init_wealth):
+            return False
+        close = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        if header.get('digest') != self._close_digest(close):
+            return False
+        self._spans   = spans
+        self._buffers = buffers
+        self._prefix  = np.load(rootname + '.npy', mmap_mode=mmap_mode)
+        self._prefix_index = pd.DatetimeIndex(header['dates'])
+        self._prefix_hold  = np.array(header['hold_wealth'])
+        return True
+
+
+    def _window_rows(self, t0, t1):
+        '''Rows of the prefix index of the first day >= t0 & of the last day <= t1'''
+        if self._prefix is None:
+            raise ValueError('window_map: build_prefix_index() or load_prefix_index() first')
+        i_0 = self._prefix_index.searchsorted(pd.Timestamp(t0), side='left')
+        i_1 = self._prefix_index.searchsorted(pd.Timestamp(t1), side='right') - 1
+        if not 0 <= i_0 < i_1 < self._prefix_index.shape[0]:
+            msg  = f'window_map: [{t0}, {t1}] should span at least two days of '
+            msg += f'{self._prefix_index[0]:%Y-%m-%d} - {self._prefix_index[-1]:%Y-%m-%d}'
+            raise ValueError(msg)
+        return i_0, i_1
 
-        # Initialize EMA returns
+
+    def window_map(self, t0, t1, fee=None):
+        '''
+        EMA map over the sub-period [t0, t1] of the prefix index: each cell
+        starts with init_wealth at t0 and keeps the signals & positions of
+        the strategy over the full date range. Unlike build_ema_map() over
+        [t0, t1], EMAs are not restarted and a position held at t0 pays no fee
+        fee -> broker's fee, the map's if None
+        Returns the (spans x buffers) map of cumulative returns net of fees
+        '''
+        i_0, i_1 = self._window_rows(t0, t1)
+        return self._rows_map(self._prefix[i_0], self._prefix[i_1],
+                              self._fee if fee is None else fee)
+
+
+    def _rows_map(self, start, end, fee):
+        '''
+        Net returns between two rows (or cell paths) of the prefix index:
+        wealth & traded wealth are rescaled to init_wealth at the start row
+        '''
+        start  = np.asarray(start, dtype=np.float64)
+        end    = np.asarray(end, dtype=np.float64)
+        growth = np.exp(end[0] - start[0])
+        fees   = fee * (end[1] - start[1]) * np.exp(-start[0])
+        return (growth * self._init_wealth - fees)/dft.INIT_WEALTH - 1
+
+
+    def window_hold(self, t0, t1):
+        '''Hold return over the sub-period [t0, t1] of the prefix index'''
+        i_0, i_1 = self._window_rows(t0, t1)
+        growth = self._prefix_hold[i_1] / self._prefix_hold[i_0]
+        return self._init_wealth * growth / dft.INIT_WEALTH - 1
+
+
+    def window_topomap(self, t0, t1, fee=None):
+        '''Returns a Topomap of window_map(t0, t1) & window_hold(t0, t1)'''
+        date_range = [pd.Timestamp(t0).to_pydatetime(), pd.Timestamp(t1).to_pydatetime()]
+        topomap = Topomap(self._name, date_range, self._strat_pos)
+        topomap.set_fee(self._fee if fee is None else fee)
+        topomap.set_spans(self._spans)
+        topomap.set_buffers(self._buffers)
+        topomap.set_emas(self.window_map(t0, t1, fee))
+        topomap.set_hold(self.window_hold(t0, t1))
+        return topomap
+
+
+    def walk_forward(self, close, train_days=dft.WF_TRAIN_DAYS, test_days=dft.WF_TEST_DAYS,
+                     fee=None):
+        '''
+        Walk-forward evaluation of the EMA strategy: the best (span, buffer)
+        of the trailing train_days window is traded over the next test_days,
+        then the window rolls forward by test_days
+        Windows are read from the prefix index (built in memory if it cannot
+        be loaded: a daily run would leave a file per end date) so that each
+        period costs two rows of the index, not a full map
+        A change of cell whose position differs from the position held
+        pays the broker's fee on the equity at the period start
+        close -> Close dataframe
+        fee -> broker's fee, the map's if None
+        Returns 2 dataframes:
+        equity  -> daily out-of-sample EQUITY & HOLD wealth, SPAN & BUFFER traded
+        periods -> start, end, span, buffer, in-sample train return,
+                   out-of-sample test & hold returns of each period
+        '''
+        fee = self._fee if fee is None else fee
+        if (self._prefix is None) and (not self.load_prefix_index(close)):
+            self.build_prefix_index(close, save = False)
+        dates  = self._prefix_index
+        n_days = dates.shape[0]
+        if n_days <= train_days + 1:
+            msg  = f'walk_forward: {n_days} days should exceed the {train_days} training days'
+            raise ValueError(msg)
+        values = close.loc[dates[0]:dates[-1], 'Close'].to_numpy(dtype=np.float64)
+
+        positions = {} # position codes of the cells traded so far
+        def get_positions(cell):
+            if cell not in positions:
+                ema   = eng.ema_matrix(values, [self._spans[cell[0]]])[0]
+                signs = eng.build_signs(values, ema, [self._buffers[cell[1]]])[0]
+                positions[cell] = eng.position_codes(signs, self._strat_pos)[0]
+            return positions[cell]
+
+        equity = np.full(n_days, np.nan)
+        cells  = np.zeros((n_days, 2), dtype=np.intp)
+        equity[train_days] = self._init_wealth
+        held    = eng.CASH
+        periods = []
+        for start in range(train_days, n_days - 1, test_days):
+            end = min(start + test_days, n_days - 1)
+            train = self._rows_map(self._prefix[start - train_days], self._prefix[start], fee)
+            cell  = np.unravel_index(np.nanargmax(train), train.shape)
+
+            cell_positions = get_positions(cell)
+            wealth = equity[start]
+            if cell_positions[start] != held: # enter, exit or reverse
+                wealth *= 1 - fee
+            path = self._prefix[start:end + 1, :, cell[0], cell[1]].T
+            test = self._rows_map(path[:, :1], path, fee)
+            equity[start + 1:end + 1] = wealth * (1 + test[1:])
+            cells[start:end + 1] = cell
+            held = cell_positions[end]
+
+            periods.append({'start'       : dates[start],
+                            'end'         : dates[end],
+                            'span'        : self._spans[cell[0]],
+                            'buffer'      : self._buffers[cell[1]],
+                            'train_return': train[cell],
+                            'test_return' : equity[end]/equity[start] - 1,
+                            'hold_return' : self._prefix_hold[end]/self._prefix_hold[start] - 1,
+                            })
+
+        rows = slice(train_days, n_days)
+        hold = self._init_wealth * self._prefix_hold[rows] / self._prefix_hold[train_days]
+        equity = pd.DataFrame({'EQUITY': equity[rows],
+                               'HOLD'  : hold,
+                               'SPAN'  : self._spans[cells[rows, 0]],
+                               'BUFFER': self._buffers[cells[rows, 1]],
+                               }, index=dates[rows])
+        return equity, pd.DataFrame(periods)
+
+
+    def build_robustness_maps(self, close, n_paths=dft.ROBUST_PATHS,
+                              block_days=dft.ROBUST_BLOCK_DAYS,
+                              percentiles=None,
+                              max_mb=dft.ROBUST_MAX_MB, n_workers=dft.N_WORKERS, seed=None):
+        '''
+        EMA map over synthetic price paths: moving block bootstrap of the
+        daily returns of close over the date range (as Ticker.get_return)
+        Paths are evaluated in chunks of at most max_mb of workspace, each
+        span as a single (paths x buffers x days) block, on n_workers processes
+        close -> Close dataframe
+        seed -> seed of the random generator, for reproducible paths
+        Returns a dictionary:
+        returns     -> (paths x spans x buffers) net EMA returns
+        hold        -> (paths,) hold returns
+        percentiles -> dictionary percentile -> (spans x buffers) map
+                       (dft.ROBUST_PERCENTILES if percentiles is None)
+        p_beat_hold -> (spans x buffers) fraction of paths beating hold
+        '''
+        if percentiles is None:
+            percentiles = dft.ROBUST_PERCENTILES
+        self._spans, self._buffers = self.get_default_grid()
+        chunks  = self._resample_paths(close, n_paths, 'bootstrap', block_days, max_mb, seed)
+        results = eng.parallel_paths(chunks, self._spans, self._buffers, self._strat_pos,
+                                     self._fee, self._init_wealth, n_workers, dft.LAG)
+        results = self._collect_paths(results, n_paths, 'Bootstrapping ema map')
+        returns = np.concatenate([result[0] for result in results])
+        hold    = np.concatenate([result[1] for result in results])
+
+        self._robust = {'returns'    : returns,
+                        'hold'       : hold,
+                        'percentiles': dict(zip(percentiles,
+                                                np.percentile(returns, percentiles, axis=0))),
+                        'p_beat_hold': (returns > hold[:, np.newaxis, np.newaxis]).mean(axis=0),
+                        }
+        return self._robust
+
+
+    @staticmethod
+    def _collect_paths(results, n_paths, title):
+        '''
+        Returns the list of the chunk results of eng.parallel_paths, the
+        progress bar advancing by the number of paths of each chunk
+        '''
+        collected = []
+        with tqdm(total = n_paths, desc = f'{title} /{n_paths} paths', ncols=40) as pbar:
+            for result in results:
+                collected.append(result)
+                pbar.update(result[0].shape[0])
+        return collected
+
+
+    def _resample_paths(self, close, n_paths, method, block_days, max_mb, seed):
+        '''
+        Generator of chunks of synthetic price paths from the daily returns
+        of close over the date range, sized so that path_grid() of a chunk
+        fits in max_mb of workspace
+        method -> 'bootstrap': moving block bootstrap (blocks drawn with replacement)
+                  'sign': daily returns in order with random signs
+                  'block': permutation of the blocks of daily returns
+        '''
+        close  = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        values = close.to_numpy(dtype=np.float64)
+        daily  = close.pct_change().to_numpy()[1:]
+        n_days = values.shape[0]
+        if method not in dft.PATH_METHODS:
+            raise ValueError(f'resample paths: method {method} should be in {dft.PATH_METHODS}')
+        if n_days <= block_days:
+            msg = f'resample paths: {n_days} days should exceed blocks of {block_days} days'
+            raise ValueError(msg)
+
+        # EMAs of all spans & the (buffers x days) block of a span per path
+        n_spans, n_buffers = self._spans.shape[0], self._buffers.shape[0]
+        path_bytes = n_days * (n_spans * 8 + n_buffers * eng.PATH_BYTES_PER_CELL)
+        chunk  = int(max(1, min(n_paths, max_mb * 1024**2 // path_bytes)))
+        n_blocks = -(-daily.shape[0] // block_days)
+
+        rng = np.random.default_rng(seed)
+        for first in range(0, n_paths, chunk):
+            size = min(chunk, n_paths - first)
+            if method == 'sign':
+                changes = daily * rng.choice([-1., 1.], (size, daily.shape[0]))
+            else:
+                if method == 'bootstrap':
+                    starts = rng.integers(0, daily.shape[0] - block_days + 1, (size, n_blocks))
+                else: # block permutation, the last block may be shorter
+                    starts = rng.permuted(np.tile(np.arange(n_blocks) * block_days, (size, 1)),
+                                          axis=1)
+                rows = (starts[:, :, np.newaxis] + np.arange(block_days)).reshape(size, -1)
+                if method == 'block': # every day once per path
+                    rows = rows[rows < daily.shape[0]].reshape(size, -1)
+                changes = daily[rows[:, :daily.shape[0]]]
+            paths = np.empty((size, n_days))
+            paths[:, 0]  = values[0]
+            paths[:, 1:] = values[0] * np.cumprod(1 + changes, axis=1)
+            yield paths
+
+
+    def get_robustness_maps(self):
+        '''Return the bootstrap robustness maps (see build_robustness_maps)'''
+        return self._robust
+
+
+    def test_significance(self, close, n_permutations=dft.SIG_PERMUTATIONS,
+                          method=dft.SIG_METHOD, block_days=dft.ROBUST_BLOCK_DAYS,
+                          max_mb=dft.ROBUST_MAX_MB, n_workers=dft.N_WORKERS, seed=None):
+        '''
+        Data-snooping adjusted significance of the best EMA (White's reality
+        check): the best excess return over hold of the whole grid is compared
+        to its distribution over price paths with no exploitable trend,
+        obtained by random signs (method='sign') or by a permutation of the
+        blocks (method='block') of the daily returns
+        close -> Close dataframe
+        Returns a dictionary:
+        span, buffer -> best cell of the grid on close
+        excess   -> its return in excess of hold
+        p_value  -> fraction of paths whose best cell does at least as well
+        naive_p_value -> fraction of paths on which the best cell alone does
+                         at least as well, ignoring the search over the grid
+        null     -> (paths,) best excess returns of the paths
+        '''
+        if method not in dft.SIG_METHODS:
+            raise ValueError(f'test_significance: method {method} should be in {dft.SIG_METHODS}')
+        self._spans, self._buffers = self.get_default_grid()
+        values = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        returns, hold = eng.path_grid(values.to_numpy(dtype=np.float64)[np.newaxis],
+                                      self._spans, self._buffers, self._strat_pos,
+                                      self._fee, self._init_wealth, dft.LAG)
+        excess = returns[0] - hold[0]
+        cell   = np.unravel_index(np.nanargmax(excess), excess.shape)
+
+        chunks  = self._resample_paths(close, n_permutations, method, block_days, max_mb, seed)
+        results = eng.parallel_paths(chunks, self._spans, self._buffers, self._strat_pos,
+                                     self._fee, self._init_wealth, n_workers, dft.LAG,
+                                     cell = cell)
+        results = self._collect_paths(results, n_permutations, 'Reality check')
+        null    = np.concatenate([result[0] for result in results])
+        at_cell = np.concatenate([result[1] for result in results])
+
+        # the observed path counts as one of the permutations
+        self._significance = {'span'         : self._spans[cell[0]],
+                              'buffer'       : self._buffers[cell[1]],
+                              'excess'       : excess[cell],
+                              'p_value'      : (1 + np.sum(null >= excess[cell]))
+                                                /(1 + n_permutations),
+                              'naive_p_value': (1 + np.sum(at_cell >= excess[cell]))
+                                                /(1 + n_permutations),
+                              'null'         : null,
+                              }
+        return self._significance
+
+
+    def get_p_value(self):
+        '''
+        Return the data-snooping adjusted p-value of the best EMA
+        (see test_significance), None if it was not tested
+        '''
+        if self._significance is None:
+            return None
+        return self._significance['p_value']
+
+
+    def _stamp_state(self, state, close):
+        '''
+        Adds the grid, run parameters & a digest of the close series
+        to a terminal state so that it is only reused with the same inputs
+        '''
+        state['spans']       = self._spans
+        state['buffers']     = self._buffers
+        state['fee']         = self._fee
+        state['lag']         = dft.LAG
+        state['init_wealth'] = self._init_wealth
+        state['n_days']      = close.shape[0]
+        state['end']         = util.date_to_string(close.index[-1], '%Y-%m-%d')
+        state['digest']      = self._close_digest(close)
+        return state
+
+
+    @staticmethod
+    def _close_digest(close):
+        '''Digest of a Close series: dates & values'''
+        digest = hashlib.sha1(close.index.to_numpy(dtype='datetime64[ns]').tobytes())
+        digest.update(close.to_numpy(dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+
+    def update_ema_map(self, close):
+        '''
+        Extends the EMA map from the terminal state of its cells to the end
+        of the date range: only the bars after the last date of the state
+        are evaluated. The statistics layers are extended if the state
+        carries their accumulators (MAP_STATS). Returns False if the state cannot be extended:
+        no state, different price history (e.g. dividend/split adjustment)
+        or an end date earlier than the state's
+        close -> Close dataframe covering the date range
+        '''
+        state = self._state
+        if state is None:
+            return False
+        close = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        end   = pd.Timestamp(str(state['end']))
+        known = close.loc[:end]
+        if (close.index[-1] < end) or (known.shape[0] != state['n_days']):
+            return False
+        if self._close_digest(known) != str(state['digest']):
+            return False
+
+        values = close.loc[close.index > end].to_numpy(dtype=np.float64)
+        if np.isnan(values).any():
+            return False
+
+        if values.shape[0] > 0:
+            ret  = eng.daily_returns(np.concatenate([[state['close']], values]),
+                                     self._strat_pos)[1:]
+            emas = eng.ema_matrix(values, self._spans, initial = state['ema'])
+            cells = {key: state[key] for key in eng.STATE_KEYS + eng.STAT_KEYS if key in state}
+            states = []
+            for i, ema in enumerate(emas):
+                states.append(eng.grid_pass(close       = values,
+                                            ema         = ema,
+                                            buffers     = self._buffers,
+                                            ret         = ret,
+                                            strat_pos   = self._strat_pos,
+                                            init_wealth = self._init_wealth,
+                                            state       = eng.span_state(cells, i),
+                                            ))
+            states = eng.stack_states(states)
+            states['ema']   = emas[:, -1]
+            states['close'] = values[-1]
+            states['hold_wealth'] = np.cumprod(np.concatenate([[state['hold_wealth']], ret]))[-1]
+            self._state = self._stamp_state(states, close)
+            # EMAs before the new bars are not kept
+            self._ema_matrix = None
+            self._ema_index  = None
+
+        state = self._state
+        self._emas   = eng.net_returns(state, self._fee, self._init_wealth)
+        # statistics from their accumulators, if the state carries them
+        self._layers = None
+        if all(key in state for key in eng.STAT_KEYS):
+            self._layers = eng.stat_layers(state, int(state['n_days']))
+        self.set_hold(self._init_wealth * state['hold_wealth'] / dft.INIT_WEALTH - 1)
+        return True
+
+
+    def _build_strategy_map(self, close):
+        '''
+        EMA map from one build_strategy() dataframe per span/buffer
+        '''
+        span_par = dft.get_spans()
         emas = np.zeros((self._spans.shape[0], self._buffers.shape[0]), dtype=np.float64)
 
         # Fill EMAS for all span/buffer combinations
         desc = f'Building ema map /{span_par["max"] - span_par["min"] + 1}'
         for i, span in tqdm(enumerate(self._spans), desc = desc, ncols=40):
             for j, buffer in enumerate(self._buffers):
-                data  = self.build_strategy(close.loc[dates[0]:dates[1], :].copy(),
-                                            span,
-                                            buffer,
-                                            )
+                data  = self.build_compact_strategy(close,
+                                                    span,
+                                                    buffer,
+                                                    )
                 emas[i][j] = self.get_cumret(data,
                                              'ema',
                                              self.get_fee(data, dft.get_actions()),
                                              )
                 if i == 0 and j == 0:
                     hold = self.get_cumret(data, 'hold')
+        return emas, hold
+
+
+    def search_best_emas(self, close, n_best, span_step=dft.SEARCH_SPAN_STEP,
+                         buffer_step=dft.SEARCH_BUFFER_STEP, n_spans=dft.SEARCH_SPAN_POINTS,
+                         n_seeds=dft.SEARCH_SEEDS):
+        '''
+        Coarse-to-fine search of the n_best cells of the EMA map:
+        evaluates a lattice of n_spans geometrically spaced spans (the map
+        varies fastest at short spans) & every buffer_step-th buffer, then a
+        lattice of half steps within span_step spans & buffer_step buffers of
+        the best max(n_best, n_seeds) cells, halving the steps down to the
+        neighbors of the best cells until they are all evaluated.
+        The search is approximate: a narrow peak between the coarse lattice
+        points of lower cells can be missed, so the best cells may differ
+        from those of the full EMA map (build_ema_map). Cells that were not
+        evaluated are NaN in the EMA map
+        close -> Close dataframe
+        Returns the number of evaluated cells
+        '''
+        self._spans, self._buffers = self.get_default_grid()
+        self._state      = None
+        self._ema_matrix = None
+        self._ema_index  = None
+
+        close  = close.loc[self._date_range[0]:self._date_range[1], 'Close']
+        values = close.to_numpy(dtype=np.float64)
+        scorer = self.get_scorer(values)
+        self.set_hold(eng.hold_return(scorer.get_returns(), self._init_wealth))
+
+        n_rows, n_buffers = self._spans.shape[0], self._buffers.shape[0]
+        self._emas = np.full((n_rows, n_buffers), np.nan)
+        self._layers = None
+
+        # coarse lattice including the first & last span & buffer
+        coarse_spans = np.geomspace(self._spans[0], self._spans[-1], n_spans)
+        span_idx   = np.unique(np.searchsorted(self._spans, np.round(coarse_spans)))
+        buffer_idx = np.unique(np.append(np.arange(0, n_buffers, buffer_step), n_buffers - 1))
+        todo = np.zeros((n_rows, n_buffers), dtype=bool)
+        todo[np.ix_(span_idx, buffer_idx)] = True
+        self._evaluate_cells(values, scorer, todo)
+
+        n_top  = max(n_best, n_seeds)
+        radius = (span_step, buffer_step)
+        while True:
+            steps = (max(radius[0] // 2, 1), max(radius[1] // 2, 1))
+            todo[:] = False
+            for i, j in self._top_cells(n_top):
+                todo[np.ix_(self._lattice(i, radius[0], steps[0], n_rows),
+                            self._lattice(j, radius[1], steps[1], n_buffers))] = True
+            todo &= np.isnan(self._emas)
+            if todo.any():
+                self._evaluate_cells(values, scorer, todo)
+            elif radius == (1, 1):
+                break
+            radius = steps
+
+        self._n_evaluated = int(np.count_nonzero(~np.isnan(self._emas)))
+        print(f'Searched ema map: {self._n_evaluated}/{n_rows * n_buffers} cells')
+        self.build_best_emas(n_best)
+        return self._n_evaluated
+
+
+    @staticmethod
+    def _lattice(center, radius, step, size):
+        '''Indices center - radius ... center + radius every step within [0, size)'''
+        indices = np.arange(center - radius, center + radius + 1, step)
+        return indices[(indices >= 0) & (indices < size)]
+
+
+    def _top_cells(self, n_best):
+        '''Indices of the n_best evaluated cells of the EMA map'''
+        emas = np.where(np.isnan(self._emas), -np.inf, self._emas).ravel()
+        n_best = min(n_best, int(np.count_nonzero(~np.isnan(self._emas))))
+        best = np.argpartition(emas, -n_best)[-n_best:]
+        return zip(*np.unravel_index(best, self._emas.shape))
+
+
+    def _evaluate_cells(self, values, scorer, cells):
+        '''
+        Evaluates the EMA map on a boolean (spans x buffers) mask of cells:
+        EMAs are computed once per span & its buffers as a single block
+        '''
+        rows = np.flatnonzero(cells.any(axis=1))
+        emas = eng.ema_matrix(values, self._spans[rows])
+        for ema, i in zip(emas, rows):
+            cols = np.flatnonzero(cells[i])
+            self._emas[i, cols] = scorer.score(ema, self._buffers[cols])['returns']
+
+
+    def get_scorer(self, close, n_buffers=None, fee=None, stats=False, mask=None, rule='hold'):
+        '''
+        Returns a topo_engine.GridScorer of close (1D array over the date range)
+        for up to n_buffers buffers at once (the default buffers if None)
+        fee -> broker's fee, the map's if None
+        stats -> the scorer also returns the statistics of the cells (eng.LAYER_KEYS)
+        mask -> days on which a SIGN may fire (see Strategy.sign_mask)
+        rule -> position rule in eng.RULES, the strategy plugin's for plugin maps
+        '''
+        if n_buffers is None:
+            n_buffers = self.get_default_grid()[1].shape[0]
+        return eng.GridScorer(close       = close,
+                              strat_pos   = self._strat_pos,
+                              fee_pct     = self._fee if fee is None else fee,
+                              init_wealth = self._init_wealth,
+                              n_buffers   = n_buffers,
+                              stats       = stats,
+                              rule        = rule,
+                              mask        = mask,
+                              )
 
-        self._emas    = emas
-        self.set_hold(hold)
+
+    def score_cells(self, close, spans, buffers, fee=None):
+        '''
+        Scores the EMA strategy on spans x buffers without building strategies
+        close -> Close series over the date range
+        fee -> broker's fee, the map's if None
+        Returns a dictionary of (spans x buffers) arrays:
+        wealth  -> final CUMRET_EMA
+        fee     -> fees in currency (get_fee)
+        trades  -> number of buys & sells
+        returns -> cumulative returns net of fees (get_cumret)
+        and the hold return as a float
+        '''
+        values = close.to_numpy(dtype=np.float64)
+        buffers = np.asarray(buffers, dtype=np.float64)
+        scorer = self.get_scorer(values, buffers.shape[0], fee)
+        scores = [scorer.score(ema, buffers) for ema in eng.ema_matrix(values, spans)]
+        scores = eng.stack_states(scores)
+        return {'wealth' : scores['wealth'] * self._init_wealth,
+                'fee'    : scores['fees'],
+                'trades' : scores['trades'],
+                'returns': scores['returns'],
+                'hold'   : eng.hold_return(scorer.get_returns(), self._init_wealth),
+                }
+
+
+    def build_ema_matrix(self, close):
+        '''
+        Computes the EMAs of close for all spans as a (spans x days) array
+        with a single recursive filter (see topo_engine.ema_matrix)
+        close -> Close series over the date range
+        '''
+        if self._spans is None:
+            self._spans = self.get_default_grid()[0]
+        if isinstance(close, pd.DataFrame):
+            close = close.Close
+        self._ema_matrix = eng.ema_matrix(close.to_numpy(dtype=np.float64), self._spans)
+        self._ema_index  = close.index
+        return self._ema_matrix
+
+
+    def _lookup_ema(self, d_frame, span):
+        '''
+        Returns the EMA of span from the EMA matrix if d_frame covers
+        the same dates from the same start, None otherwise
+        '''
+        if self._ema_matrix is None:
+            return None
+        row = np.flatnonzero(self._spans == span)
+        n_days = d_frame.shape[0]
+        if (row.shape[0] == 0) or (n_days > self._ema_index.shape[0]):
+            return None
+        if not self._ema_index[:n_days].equals(d_frame.index):
+            return None
+        return self._ema_matrix[row[0], :n_days]
 
 
     @staticmethod
-    def build_moving_average(dataframe, span, buffer, mean_type):
+    def build_moving_average(dataframe, span, buffer, mean_type, ema=None):
         '''
         Builds moving average column and its buffers
         mean_type = string either 'EMA' (exponential) or 'SMA' (simple)
+        ema -> optional precomputed EMA values (from the EMA matrix)
         '''
         # Compute exponential weighted mean 'EMA'
-        if mean_type == 'EMA':
+        if (mean_type == 'EMA') and (ema is not None):
+            dataframe.loc[:, 'EMA'] = ema
+        elif mean_type == 'EMA':
             dataframe.loc[:, 'EMA'] = dataframe.Close.ewm(span=span, adjust=False).mean()
         elif mean_type == 'SMA':
             dataframe.loc[:, 'SMA'] = dataframe.Close.rolling(window=int(span)).mean()
@@ -212,27 +1256,30 @@ class Topomap():
         RET2 -> 1 + % daily return when Close > EMA
         CUMRET_EMA -> cumulative returns for the EMA strategy
         '''
-        # Build EMA & its buffers
-        d_frame = self.build_moving_average(d_frame, span, buffer, 'EMA')
-
-        # Build SMA & its buffers
-        d_frame = self.build_moving_average(d_frame, span, buffer, 'SMA')
+        # Compact strategy, converted to the dataframe layout
+        self._strategy_frame = self.build_compact_strategy(d_frame, span, buffer)
+        return self._strategy_frame.to_frame(d_frame)
 
-        # build the SIGN column (above/in/below buffer)
-        d_frame = self.build_sign(d_frame, buffer)
 
-        # build the POSITION (long/cash) & ACTION (buy/sell) columns
-        d_frame = self.build_positions(d_frame)
-
-        # compute returns from a hold strategy
-        d_frame = self.build_hold(d_frame)
-
-        # compute returns from the EMA strategy
-        d_frame = self.build_ema(d_frame)
-
-        self._strategy = d_frame
-
-        return d_frame
+    def build_compact_strategy(self, d_frame, span, buffer, dtype=np.float64):
+        '''
+        Implements the EMA strategy of build_strategy() as a StrategyFrame:
+        int8 position & action codes, price columns in dtype (float64 or
+        float32) and SMA & buffer columns computed on request only
+        '''
+        # EMA from the EMA matrix when available
+        ema = self._lookup_ema(d_frame, span)
+        if ema is None:
+            ema = d_frame.Close.ewm(span=span, adjust=False).mean().to_numpy()
+        return sfr.StrategyFrame(index       = d_frame.index,
+                                 close       = d_frame.Close.to_numpy(),
+                                 ema         = ema,
+                                 span        = span,
+                                 buffer      = buffer,
+                                 strat_pos   = self._strat_pos,
+                                 init_wealth = self._init_wealth,
+                                 dtype       = dtype,
+                                 )
 
 
     @staticmethod
@@ -255,94 +1302,15 @@ class Topomap():
         Builds desired positions & actions for long/short EMA strategies
         POSITION -> cash, long, short
         ACTION -> buy, sell, n/c (no change)
+        The state machine runs on the integer codes of topo_engine, the
+        string columns are decoded from them
         '''
-        def handle_long(prev_pos:str, prev_sign:str, sign:int):
-            '''handler for long trading position'''
-            # Build the action
-            if sign in (0, prev_sign):
-                action = 'n/c'
-            elif sign == 1: # previous sign is -1 or 0
-                if prev_pos == 'cash':
-                    action = 'buy'
-                elif prev_pos == 'long':
-                    action = 'n/c'
-                else:
-                    action = None
-            else: #sign == -1:
-                if prev_pos == 'cash':
-                    action = 'n/c'
-                elif prev_pos == 'long':
-                    action = 'sell'
-                else:
-                    action = None
-
-            # build the position
-            if action == 'buy':
-                position = 'long'
-            elif action == 'sell':
-                position = 'cash'
-            elif action == 'n/c':
-                position = prev_pos
-            else:
-                msg = f'TopoMap.handle_long position={position} action={action}'
-                raise ValueError(msg)
-            return [position, action]
-
-        def handle_short(prev_pos:str, prev_sign:str, sign:int):
-            '''handler for long trading position'''
-            # Build the action
-            if sign in (0, prev_sign):
-                action = 'n/c'
-            elif sign == 1: # previous sign is -1 or 0
-                if prev_pos == 'cash':
-                    action = 'n/c'
-                elif prev_pos == 'short':
-                    action = 'buy'
-                else:
-                    action = None
-            else: #sign == -1:
-                if prev_pos == 'cash':
-                    action = 'sell'
-                elif prev_pos == 'short':
-                    action = 'n/c'
-                else:
-                    action = None
-
-            # build the position
-            if action == 'buy':
-                position = 'cash'
-            elif action == 'sell':
-                position = 'short'
-            elif action == 'n/c':
-                position = prev_pos
-            else:
-                msg = f'TopoMap.handle_short position={position} action={action}'
-                raise ValueError(msg)
-            return [position, action]
-
-
-        n_time_steps       = d_frame.shape[0]
-        positions, actions = ([] for i in range(2))
-
-        # Set initial value
-        positions.append(dft.POSITIONS[2])
-        actions.append(dft.ACTIONS[2])
-
-        for step in range(1, n_time_steps):
-            sign      = d_frame.loc[d_frame.index[step], 'SIGN']
-            prev_sign = d_frame.loc[d_frame.index[step - 1], 'SIGN']
-            prev_position = positions[step - 1]
-            if self._strat_pos == 'long':
-                pos_act = handle_long(prev_position, prev_sign, sign)
-            elif self._strat_pos == 'short':
-                pos_act = handle_short(prev_position, prev_sign, sign)
-            else:
-                raise ValueError(f'build_positions: "{self._strat_pos}" long or short positions only')
-            positions.append(pos_act[0])
-            actions.append(pos_act[1])
+        positions, actions = eng.position_codes(d_frame.SIGN.to_numpy(), self._strat_pos)
 
-        d_frame.insert(loc=len(d_frame.columns), column='POSITION', value=positions)
-        d_frame.insert(loc=len(d_frame.columns), column='ACTION', value=actions)
+        d_frame.insert(loc=len(d_frame.columns), column='POSITION',
+                       value=eng.decode_positions(positions))
+        d_frame.insert(loc=len(d_frame.columns), column='ACTION',
+                       value=eng.decode_actions(actions))
         return d_frame
 
 
@@ -398,7 +1366,10 @@ class Topomap():
         FEE_PCT -> brokers fee
         actions = ['buy', 'sell', 'n/c']
         fee -> $ fee corresponding to self._fee (%)
+        data -> strategy dataframe or StrategyFrame
         '''
+        if isinstance(data, sfr.StrategyFrame):
+            return data.get_fee(self._fee)
         # Add a fee for each movement: mask buys
         fee  = (self._fee * data[data.ACTION == actions[0]].CUMRET_EMA.sum())
         # Mask sells
@@ -408,7 +1379,7 @@ class Topomap():
 
     def get_recom_strategy(self):
         '''Returns the recommended (last row) of the strategy dataframe '''
-        current = self._strategy.iloc[-1]
+        current = self._strategy_frame.get_row(-1)
         return current
 
 
@@ -420,6 +1391,8 @@ class Topomap():
         If strategy is EMA, returns cumulative returns net of fees
         *** FIX FEES ***
         '''
+        if isinstance(data, sfr.StrategyFrame):
+            return data.get_cumret(strategy, fee)
         if strategy.lower() == 'hold':
             return data.CUMRET_HOLD[-1]/dft.INIT_WEALTH - 1
         if strategy.lower() == 'ema':
@@ -434,57 +1407,324 @@ class Topomap():
         Return the persist filename for the ema map without extension
         '''
         dates   = util.dates_to_strings(self._date_range, '%Y-%m-%d')
-        suffix  = f'{dates[0]}_{dates[1]}_{self._strat_pos}_ema_map'
+        suffix  = f'{dates[0]}_{dates[1]}_{self._strat_pos}_{self._family}_map'
         suffix = f'{self._name}_{suffix}'
         return suffix
 
-    def load_ema_map(self, ticker_object, refresh, verbose=False):
+    def get_prefix_rootname(self):
         '''
-        Reads raw EMA data from csv file, reshape and  and returns as a dataframe
+        Return the persist pathname of the prefix index without extension
         '''
-        # Read EMA map values  from file or compute if not saved
-        data_dir = os.path.join(dft.DATA_DIR, ticker_object.get_symbol())
-        file     = self.get_ema_map_filename() + '.csv'
-        map_path = os.path.join(data_dir, file)
-        if (os.path.exists(map_path)) & (not refresh):
-            if verbose:
-                print(f'Loading EMA map {map_path}')
+        dates = util.dates_to_strings(self._date_range, '%Y-%m-%d')
+        filename = f'{self._name}_{dates[0]}_{dates[1]}_{self._strat_pos}_prefix'
+        return os.path.join(dft.DATA_DIR, self._name, filename)
+
+    def get_ema_state_filename(self):
+        '''
+        Return the persist filename for the terminal state of the ema map
+        without extension. Only the start date is in the name: the state of
+        a date range is extended to later end dates
+        '''
+        start = util.date_to_string(self._date_range[0], '%Y-%m-%d')
+        return f'{self._name}_{start}_{self._strat_pos}_ema_state'
+
+    def save_ema_state(self):
+        '''
+        Save the terminal state of the ema map cells to file
+        '''
+        if self._state is None:
+            return
+        data_dir = os.path.join(dft.DATA_DIR, self._name)
+        os.makedirs(data_dir, exist_ok = True)
+        np.savez(os.path.join(data_dir, self.get_ema_state_filename() + '.npz'),
+                 **self._state)
+
+    def load_ema_state(self):
+        '''
+        Load the terminal state of the ema map cells from file
+        Returns False if there is none, if it was built with a different
+        grid or different run parameters or if it lacks the accumulators of
+        the statistics layers (MAP_STATS)
+        '''
+        pathname = os.path.join(dft.DATA_DIR, self._name,
+                                self.get_ema_state_filename() + '.npz')
+        if not os.path.exists(pathname):
+            return False
+        with np.load(pathname) as data:
+            state = {key: data[key] for key in data.files}
+
+        spans, buffers = self.get_default_grid()
+        if not (np.array_equal(state['spans'], spans)
+                and np.array_equal(state['buffers'], buffers)
+                and state['fee'] == self._fee
+                and state['lag'] == dft.LAG
+                and state['init_wealth'] == self._init_wealth):
+            return False
+        if dft.MAP_STATS and not all(key in state for key in eng.STAT_KEYS):
+            return False
+        self._spans   = spans
+        self._buffers = buffers
+        self._state   = state
+        return True
+
+
+    def get_cache_key(self, close):
+        '''
+        Return the EMA map cache key of close (Close series of the ticker):
+        hash of the prices over the date range & of the map parameters
+        '''
+        spans, buffers = self.get_default_grid()
+        return emc.EmaMapCache.build_key(close.loc[self._date_range[0]:self._date_range[1], 'Close'],
+                                         self._strat_pos,
+                                         spans,
+                                         buffers,
+                                         self._fee,
+                                         dft.LAG,
+                                         self._init_wealth,
+                                         self._strategy.get_key(),
+                                         )
+
+
+    def load_ema_map(self, ticker_object, refresh, verbose=False, n_workers=dft.N_WORKERS,
+                     incremental=dft.INCREMENTAL_MAP, use_cache=dft.EMA_CACHE):
+        '''
+        Reads the EMA map from the cache or from file (binary or legacy csv)
+        or computes it
+        refresh -> recompute the map from scratch, without the cache, the
+                   map files or the saved terminal state
+        n_workers -> number of processes used if the map must be computed
+        incremental -> if the map must be computed, extend the saved terminal
+                       state of the map with the same start date when possible
+        use_cache -> look the map up in the content-addressed cache rather
+                     than by filename, so that a map computed from other
+                     prices or parameters is never reused
+        '''
+        if not self._read_ema_map(ticker_object, refresh, verbose, incremental, use_cache):
+            self.build_ema_map(ticker_object.get_close(), self._date_range,
+                               n_workers = n_workers,
+                               )
+            self._save_ema_map(ticker_object, use_cache)
 
-            pathname = os.path.join(data_dir,
-                                    self.get_ema_map_filename() + '.csv')
 
-            ema_map = pd.read_csv(pathname, sep=';', index_col=0)
+    @classmethod
+    def load_ema_maps(cls, ticker_object, date_range, positions, refresh, verbose=False,
+                      n_workers=dft.N_WORKERS, incremental=dft.INCREMENTAL_MAP,
+                      use_cache=dft.EMA_CACHE):
+        '''
+        load_ema_map() for several strategic positions of a ticker:
+        the maps that must be computed are built in a single pass sharing
+        EMAs & SIGN arrays, and saved under their own filenames
+        Returns a dictionary strategic position -> Topomap
+        '''
+        topomaps = {position: cls(ticker_object.get_symbol(), date_range, position)
+                    for position in positions}
+        missing = [topomap for topomap in topomaps.values()
+                   if not topomap._read_ema_map(ticker_object, refresh, verbose,
+                                                incremental, use_cache)]
+        if missing:
+            missing[0].build_ema_map(ticker_object.get_close(), date_range,
+                                     n_workers = n_workers,
+                                     others    = missing[1:],
+                                     )
+            for topomap in missing:
+                topomap._save_ema_map(ticker_object, use_cache)
+        return topomaps
+
+
+    @classmethod
+    def load_panel_maps(cls, ticker_objects, date_ranges, positions, refresh, verbose=False,
+                        incremental=dft.INCREMENTAL_MAP, use_cache=dft.EMA_CACHE,
+                        max_mb=dft.PANEL_MAX_MB):
+        '''
+        load_ema_map() for several tickers: the maps that must be computed are
+        built in a single panel pass (see build_panel_maps) & saved under
+        their own filenames
+        ticker_objects, date_ranges, positions -> one per ticker
+        Returns the list of Topomaps in ticker order
+        '''
+        topomaps = [cls(ticker_object.get_symbol(), date_range, position)
+                    for ticker_object, date_range, position
+                    in zip(ticker_objects, date_ranges, positions)]
+        missing = [i for i, topomap in enumerate(topomaps)
+                   if not topomap._read_ema_map(ticker_objects[i], refresh, verbose,
+                                                incremental, use_cache)]
+        if missing:
+            cls.build_panel_maps([topomaps[i] for i in missing],
+                                 [ticker_objects[i].get_close() for i in missing],
+                                 max_mb,
+                                 )
+            for i in missing:
+                topomaps[i]._save_ema_map(ticker_objects[i], use_cache)
+        return topomaps
 
-            spans   = ema_map['span'].to_numpy()
-            buffers = ema_map['buffer'].to_numpy()
-            emas    = ema_map['ema'].to_numpy()
-            hold    = ema_map['hold'].to_numpy()
 
-            # reshape the arrays
-            spans   = np.unique(spans)
-            buffers = np.unique(buffers)
-            emas    = np.reshape(emas, (spans.shape[0], buffers.shape[0]))
+    @staticmethod
+    def panel_closes(closes, date_ranges):
+        '''
+        Aligns the Close series of several tickers over their date ranges
+        onto their shared trading calendar (the union of their trading days)
+        closes -> Close dataframes / date_ranges -> one date range per ticker
+        Returns a (days x tickers) dataframe, NaN on the days a ticker does
+        not trade (holidays, before listing or after delisting)
+        '''
+        columns = [close.loc[dates[0]:dates[1], 'Close'] for close, dates in zip(closes, date_ranges)]
+        return pd.concat(columns, axis=1, keys=range(len(columns))).sort_index()
 
-            self._spans   = spans
-            self._buffers = buffers
-            self._emas    = emas
-            self.set_hold(hold)
-        else: # If not saved, compute it
+
+    @staticmethod
+    def build_panel_maps(topomaps, closes, max_mb=dft.PANEL_MAX_MB):
+        '''
+        EMA maps of several tickers in one vectorized pass over their panel of
+        closes (see panel_closes & topo_engine.panel_grid): the tickers of
+        each strategic position & fee are evaluated together
+        topomaps -> Topomaps of the tickers, each with its own date range
+        closes -> Close dataframes of the tickers, in the order of topomaps
+        Each map equals the build_ema_map() grid map of its ticker; panel
+        maps have no statistics layers & no terminal state to extend
+        '''
+        panel = Topomap.panel_closes(closes, [topomap._date_range for topomap in topomaps])
+        panel = panel.to_numpy(dtype=np.float64).T
+        spans, buffers = Topomap.get_default_grid()
+        groups = {}
+        for i, topomap in enumerate(topomaps):
+            key = (topomap._strat_pos, topomap._fee, topomap._init_wealth)
+            groups.setdefault(key, []).append(i)
+
+        for (strat_pos, fee, init_wealth), rows in groups.items():
+            returns, hold = eng.panel_grid(panel[rows], spans, buffers, strat_pos, fee,
+                                           init_wealth, dft.LAG, max_mb)
+            for j, i in enumerate(rows):
+                topomap = topomaps[i]
+                topomap._spans, topomap._buffers = spans, buffers
+                topomap._state  = None
+                topomap._layers = None
+                topomap._family = 'ema'
+                topomap._emas   = returns[j]
+                topomap._n_evaluated = returns[j].size
+                topomap.set_hold(hold[j])
+
+
+    def _read_ema_map(self, ticker_object, refresh, verbose, incremental, use_cache):
+        '''
+        Reads the EMA map from the cache or from file, or extends its saved
+        terminal state to the end of the date range (see load_ema_map)
+        Returns False if the map must be built
+        '''
+        if use_cache:
+            key    = self.get_cache_key(ticker_object.get_close())
+            cached = None if refresh else emc.EmaMapCache().load(key)
+            if cached is not None:
+                if verbose:
+                    print(f'Loading EMA map {key} from cache')
+                self._spans, self._buffers = self.get_default_grid()
+                self._emas   = cached[0]
+                self._layers = cached[2]
+                self.set_hold(cached[1])
+                return True
+        else:
+            # Read EMA map values  from file or compute if not saved
+            data_dir = os.path.join(dft.DATA_DIR, ticker_object.get_symbol())
+            rootname = os.path.join(data_dir, self.get_ema_map_filename())
+            if os.path.exists(rootname + '.npy') & (not refresh):
+                if verbose:
+                    print(f'Loading EMA map {rootname}.npy')
+                self.read_binary_map(rootname)
+                return True
+            if os.path.exists(rootname + '.csv') & (not refresh):
+                if verbose:
+                    print(f'Loading EMA map {rootname}.csv')
+                self.read_csv_map(rootname)
+                # Convert to the default format
+                self.save_emas()
+                return True
             if verbose & (not refresh):
-                print(f'No EMA map in {map_path}')
-            self.build_ema_map(ticker_object.get_close(), self._date_range)
+                print(f'No EMA map in {rootname}')
+
+        if (not refresh and incremental and self._strategy.incremental and self.load_ema_state()
+                and self.update_ema_map(ticker_object.get_close())):
+            if verbose:
+                print(f'EMA map extended to {self._state["end"]}')
+            self._save_ema_map(ticker_object, use_cache)
+            return True
+        return False
+
+
+    def _save_ema_map(self, ticker_object, use_cache):
+        '''
+        Saves a computed EMA map & its terminal state to file
+        and stores the map in the cache
+        '''
+        self.save_ema_state()
         # Save ema map to file
         self.save_emas()
+        if use_cache:
+            description = {'ticker'  : self._name,
+                           'position': self._strat_pos,
+                           'dates'   : util.dates_to_strings(self._date_range, '%Y-%m-%d'),
+                           }
+            emc.EmaMapCache().store(self.get_cache_key(ticker_object.get_close()),
+                                    self._emas,
+                                    self._hold,
+                                    description,
+                                    self._layers,
+                                    )
+
 
+    def read_csv_map(self, rootname):
+        '''
+        Reads the EMA map from a ; separated csv file of span, buffer, ema, hold rows
+        '''
+        ema_map = pd.read_csv(rootname + '.csv', sep=';', index_col=0)
 
-    def build_best_emas(self, n_best):
-        '''computes best emas'''
+        spans   = ema_map['span'].to_numpy()
+        buffers = ema_map['buffer'].to_numpy()
+        emas    = ema_map['ema'].to_numpy()
+        hold    = ema_map['hold'].to_numpy()
+
+        # reshape the arrays
+        spans   = np.unique(spans)
+        buffers = np.unique(buffers)
+        emas    = np.reshape(emas, (spans.shape[0], buffers.shape[0]))
+
+        self._spans   = spans
+        self._buffers = buffers
+        self._emas    = emas
+        self._layers  = None
+        self.set_hold(hold)
+
+
+    def read_binary_map(self, rootname, mmap_mode='r'):
+        '''
+        Reads the EMA map from its raw float array (memory-mapped by default)
+        and the span/buffer axes & hold from its json header
+        '''
+        with open(rootname + '.json', 'r', encoding='utf-8') as header_file:
+            header = json.load(header_file)
+        self._spans   = np.array(header['spans'])
+        self._buffers = np.array(header['buffers'], dtype=np.float64)
+        self._emas    = np.load(rootname + '.npy', mmap_mode=mmap_mode)
+        self.set_hold(header['hold'])
+        self._layers  = None
+        if os.path.exists(rootname + '_layers.npz'):
+            with np.load(rootname + '_layers.npz') as layers:
+                self._layers = {key: layers[key] for key in layers.files}
+
+
+    def build_best_emas(self, n_best, layer='ema'):
+        '''
+        computes best emas
+        layer -> map layer the cells are ranked by (see get_layer), in the
+                 direction of dft.MAP_LAYERS: e.g. highest Sharpe ratio or
+                 fewest trades. The ema column is the cell's net return
+        '''
         self._n_best = n_best
         results = np.zeros(shape=(n_best, 4))
 
         # Build a n_best x 4 dataframe
         # copy b/c algorithm destroys top n_maxima EMA values
-        _emas = self.get_emas().copy()
+        # cells not evaluated by a search (NaN) are never selected
+        values = self.get_layer(layer) * dft.MAP_LAYERS[layer][2]
+        _emas = np.where(np.isnan(values), - dft.HUGE, values)
 
         for i in range(n_best):
             # Get coordinates of maximum emas value
@@ -493,7 +1733,7 @@ class Topomap():
 
             results[i][0] = self._spans[max_idx[0]]
             results[i][1] = self._buffers[max_idx[1]]
-            results[i][2] = np.max(_emas)
+            results[i][2] = self._emas[max_idx]
             results[i][3] = self._hold
 
             # set max emas value to arbitrily small number and re-iteratedates_to_strings
@@ -506,20 +1746,54 @@ class Topomap():
         self.save_best_emas() # save to file
 
 
-    def save_emas(self):
+    def save_emas(self, fmt=dft.EMA_MAP_FORMAT):
         '''
         Save ema map to file
+        fmt = 'npy': raw float64 array & json header with axes, hold, fee & dates
+        fmt = 'csv': ; separated span, buffer, ema, hold rows
         '''
-        temp = []
-        for i, span in enumerate(self.get_spans()):
-            for j, buffer in enumerate(self.get_buffers()):
-                temp.append([span, buffer, self.get_emas()[i,j], self._hold])
-
-        temp   = pd.DataFrame(temp, columns=['span', 'buffer', 'ema', 'hold'])
-        suffix = self.get_ema_map_filename()
+        suffix   = self.get_ema_map_filename()
         data_dir = os.path.join(dft.DATA_DIR, self._name)
 
-        self._save_dataframe(temp, data_dir, suffix, 'csv')
+        if fmt == 'npy':
+            os.makedirs(data_dir, exist_ok = True)
+            rootname = os.path.join(data_dir, suffix)
+            # write to a new file: the current one may be memory-mapped
+            np.save(rootname + '.tmp.npy', np.asarray(self._emas, dtype=np.float64))
+            os.replace(rootname + '.tmp.npy', rootname + '.npy')
+            self._save_map_header(rootname)
+        elif fmt == 'csv':
+            n_spans, n_buffers = self._emas.shape
+            temp = pd.DataFrame({'span'  : np.repeat(self._spans, n_buffers),
+                                 'buffer': np.tile(self._buffers, n_spans),
+                                 'ema'   : np.ravel(self._emas),
+                                 'hold'  : self._hold,
+                                 })
+            self._save_dataframe(temp, data_dir, suffix, 'csv')
+        else:
+            raise ValueError(f'ema map format {fmt} should be in {dft.EMA_MAP_FORMATS}')
+
+
+    def _save_map_header(self, rootname):
+        '''
+        Saves the json header (axes, hold, fee & dates) of the npy EMA map
+        rootname.npy & its statistics layers, removed if the map has none
+        '''
+        header = {'ticker'   : self._name,
+                  'position' : self._strat_pos,
+                  'dates'    : util.dates_to_strings(self._date_range, '%Y-%m-%d'),
+                  'spans'    : self._spans.tolist(),
+                  'buffers'  : self._buffers.tolist(),
+                  'hold'     : float(self._hold),
+                  'fee'      : self._fee,
+                  }
+        with open(rootname + '.json', 'w', encoding='utf-8') as header_file:
+            json.dump(header, header_file)
+        if self._layers is not None:
+            np.savez(rootname + '_layers.tmp.npz', **self._layers)
+            os.replace(rootname + '_layers.tmp.npz', rootname + '_layers.npz')
+        elif os.path.exists(rootname + '_layers.npz'):
+            os.remove(rootname + '_layers.npz')
 
 
     def save_best_emas(self):
@@ -534,6 +1808,8 @@ class Topomap():
             raise ValueError(msg)
         start, end = util.dates_to_strings(self._date_range, '%Y-%m-%d')
         suffix = f'{self._name}_{start}_{end}_{self._strat_pos}_results'
+        if self._family != 'ema':
+            suffix += f'_{self._family}'
 
         data_dir = os.path.join(dft.DATA_DIR, self._name)
         os.makedirs(data_dir, exist_ok = True)
@@ -562,10 +1838,11 @@ class Topomap():
     ##########################
     ### Plotting functions ###
     ##########################
-    def surface_plot(self, ticker_object, date_range, style, plot_fmt):
+    def surface_plot(self, ticker_object, date_range, style, plot_fmt, layer='ema'):
         '''
         plotly surface and contour plots
         style = surface or contour
+        layer -> map layer to plot (see get_layer)
         '''
         plot_width  = 750
         plot_height = 750
@@ -573,18 +1850,26 @@ class Topomap():
         if style not in ['contour', 'surface']:
             msg = f'style {style} should be contour or surface'
             raise AssertionError(msg)
+        if self._family == 'ema' and self.is_partial_map(): # the plots need the full grid
+            self.load_ema_map(ticker_object, refresh = False)
+            self.build_best_emas(self._n_best)
+
+        label, tick_fmt, sense = dft.MAP_LAYERS[layer]
+        yaxis_title, xaxis_title, x_fmt = dft.MAP_FAMILIES.get(self._family,
+                                                               dft.MAP_FAMILIES['ema'])
+        z_values = self.get_layer(layer)
+
         def extract_best_ema():
             '''
-            find highest ema value and corresponding span/buffer
-            in _best_emas dataframe
+            find the best cell of the layer (highest ema value by default)
+            and corresponding span/buffer
             '''
-            idx_max  = self._best_emas['ema'].idxmax()
-            max_ema  = self._best_emas['ema'].max()
-            max_span = self._best_emas.span.iloc[idx_max]
-            max_buff = self._best_emas.buffer.iloc[idx_max]
-            return max_span, max_buff, max_ema
+            idx_max  = np.unravel_index(np.nanargmax(z_values * sense), z_values.shape)
+            max_span = self._spans[idx_max[0]]
+            max_buff = self._buffers[idx_max[1]]
+            return max_span, max_buff, self._emas[idx_max], z_values[idx_max]
 
-        def _build_title(ticker, dates, ema, span, buffer):
+        def _build_title(ticker, dates, ema, span, buffer, value):
             ''' Build plot title '''
             hold     = self._hold
             ticker_name   = ticker.get_name()
@@ -592,15 +1877,22 @@ class Topomap():
             title  = f'{ticker_name} ({ticker_symbol}) | '
             title += f'{self._strat_pos.capitalize()} position | '
             title += f'{dates[0]} - {dates[1]}<br>'
-            title += f'Max payoff={ema:.2%} (hold={hold:.2%}) | '
-            title += f'{span:.0f}-day mean | '
-            title += f'buffer={buffer:.2%}'
+            if layer == 'ema':
+                title += f'Max payoff={ema:.2%} (hold={hold:.2%}) | '
+            else:
+                title += f'Best {label.lower()}={value:{tick_fmt}} | '
+                title += f'payoff={ema:.2%} (hold={hold:.2%}) | '
+            if self._family == 'crossover':
+                title += f'{span:.0f}/{buffer:.0f}-day crossover | '
+                title += f'buffer={self._cross_buffer:.2%}'
+            else:
+                title += f'{span:.0f}-day {self._family.upper()} | '
+                title += f'buffer={buffer:.2%}'
             return title
 
-        max_span, max_buff, max_ema = extract_best_ema()
+        max_span, max_buff, max_ema, max_value = extract_best_ema()
         y_values = self._spans
         x_values = self._buffers
-        z_values = self._emas
 
         title_range = util.dates_to_strings([date_range[0],
                                              date_range[1]],
@@ -614,18 +1906,17 @@ class Topomap():
                              ema    = max_ema,
                              span   = max_span,
                              buffer = max_buff,
+                             value  = max_value,
                              )
-        # Axes
-        xaxis_title = 'Buffer'
-        yaxis_title = 'Span (days)'
 
         #color bar
-        colorbar_dict = dict(title='Return',
+        colorbar_dict = dict(title=label,
                              titleside='top',
-                             tickformat='.0%',
+                             tickformat=tick_fmt,
                              separatethousands=True,)
         # Hover
-        hovertemplate = 'Buffer=%{x:.1%}<br>Span=%{y} days<br>Return=%{z:.1%}<extra></extra>'
+        hovertemplate  = f'{xaxis_title}=%{{x:{x_fmt}}}<br>{yaxis_title}=%{{y}}<br>'
+        hovertemplate += f'{label}=%{{z:{tick_fmt}}}<extra></extra>'
 
         # Default layout
         layout = go.Layout(title           = title,
@@ -638,7 +1929,7 @@ class Topomap():
                            width  = plot_width,
                            height = plot_height,
                            margin = dict(l=100, r=50, b=100, t=100),
-                           xaxis  = dict(tickformat=".0%"),
+                           xaxis  = dict(tickformat=x_fmt),
                            )
 
         if style == 'surface':
@@ -660,12 +1951,12 @@ class Topomap():
                                               )
                               )
 
-            fig.update_layout(scene = dict(xaxis = dict(nticks=10, tickformat=".0%"),
+            fig.update_layout(scene = dict(xaxis = dict(nticks=10, tickformat=x_fmt),
                                            yaxis = dict(nticks=10),
-                                           zaxis = dict(nticks=10, tickformat=".0%"),
+                                           zaxis = dict(nticks=10, tickformat=tick_fmt),
                                            xaxis_title = xaxis_title,
                                            yaxis_title = yaxis_title,
-                                           zaxis_title = 'return',
+                                           zaxis_title = label.lower(),
                                            )
                               )
         else: # contour plot
@@ -684,11 +1975,11 @@ class Topomap():
                             )
 
             # Hover
-            fig.update_layout(xaxis=dict(hoverformat='.2%'),
+            fig.update_layout(xaxis=dict(hoverformat=x_fmt),
                               yaxis=dict(hoverformat='.0f'),)
 
         os.makedirs(os.path.join(dft.PLOT_DIR, self._name), exist_ok = True)
-        filename = self.get_plot_filename(ticker_object, name_range, style, plot_fmt)
+        filename = self.get_plot_filename(ticker_object, name_range, style, plot_fmt, layer)
 
         #plotly.offline.plot(fig, filename=filename)
         if plot_fmt == 'html':
@@ -708,7 +1999,7 @@ class Topomap():
         return fig
 
 
-    def get_plot_filename(self, ticker, name_range, style, extension):
+    def get_plot_filename(self, ticker, name_range, style, extension, layer='ema'):
         ''' Build file name '''
         plot_dir = os.path.join(dft.PLOT_DIR, self._name)
         filename  = f'{ticker.get_symbol()}_'
@@ -718,6 +2009,10 @@ class Topomap():
             filename += '_surface'
         else:
             filename += '_contour'
+        if self._family != 'ema':
+            filename += f'_{self._family}'
+        if layer != 'ema':
+            filename += f'_{layer}'
         return f"{plot_dir}/{filename}.{extension}"
 
 
@@ -822,37 +2117,72 @@ class Topomap():
         trplt.save_figure(plot_dir, filename)
 
 
-    def build_ema_profile(self, security, var_name, variables, fixed):
+    def build_ema_profile(self, security, var_name, variables, fixed, fee=None):
         ''' Aggregates a 1D numpy array of EMAs as a function of
             the target variable (span or buffer)
             the fixed variable (buffer or span)
             returns the numpy array of EMAs as well as the value for a hold strategy
+            Points of the EMA map grid are read from the map, only the
+            others are evaluated (see score_cells)
+            fee -> broker's fee, the map's if None
+            Only defined for EMA maps (family 'ema')
         '''
-        emas  = np.zeros(variables.shape)
+        if self._family != 'ema':
+            raise ValueError(f'build_ema_profile: the {self._family} map has no EMA profile')
         date_range = self.get_date_range()
+        close = security.loc[date_range[0]:date_range[1], 'Close']
+        variables = np.asarray(variables)
 
         if var_name == 'span':
-            buffer = fixed
+            spans, buffers = variables, np.array([fixed])
         elif var_name == 'buffer':
-            span   = fixed
+            spans, buffers = np.array([fixed]), variables
         else:
             raise ValueError(f'var_name {var_name} should be span or buffer')
 
-        for i, variable in enumerate(variables):
-            if var_name == 'span':
-                span   = variable
-            else:
-                buffer = variable
-
-            dfr = self.build_strategy(security.loc[date_range[0]:date_range[1], :].copy(),
-                                      span,
-                                      buffer,
-                                      )
-            fee = self.get_fee(dfr,
-                               dft.get_actions())
-            ema = self.get_cumret(dfr, 'ema', fee)
-            emas[i] = ema
-            if i == 0:
-                hold = self.get_cumret(dfr, 'hold', dft.INIT_WEALTH)
+        if fee in (None, self._fee):
+            emas = self._slice_map(spans, buffers)
+        else: # the map was computed with another fee
+            emas = np.full((spans.shape[0], buffers.shape[0]), np.nan)
+        hold = self._hold
 
-        return emas, hold
+        missing = np.isnan(emas)
+        if missing.any():
+            rows, cols = missing.any(axis=1), missing.any(axis=0)
+            scores = self.score_cells(close, spans[rows], buffers[cols], fee)
+            block  = np.ix_(rows, cols)
+            emas[block] = np.where(missing[block], scores['returns'], emas[block])
+            hold = scores['hold']
+
+        return emas.ravel(), hold
+
+
+    def _slice_map(self, spans, buffers):
+        '''
+        Returns the (spans x buffers) values of the EMA map,
+        NaN for the spans & buffers that are not on its grid
+        '''
+        if self._family != 'ema':
+            raise ValueError(f'_slice_map: the {self._family} map is not an EMA map')
+        emas = np.full((spans.shape[0], buffers.shape[0]), np.nan)
+        if self._emas is None:
+            return emas
+        rows = self._grid_index(self._spans, spans)
+        cols = self._grid_index(self._buffers, buffers)
+        on_rows, on_cols = rows >= 0, cols >= 0
+        emas[np.ix_(on_rows, on_cols)] = np.asarray(self._emas)[np.ix_(rows[on_rows],
+                                                                       cols[on_cols])]
+        return emas
+
+
+    @staticmethod
+    def _grid_index(axis, values):
+        '''Index of each value on a grid axis, -1 if it is not on the axis'''
+        matches = np.isclose(np.asarray(values, dtype=np.float64)[:, np.newaxis],
+                             np.asarray(axis, dtype=np.float64)[np.newaxis, :],
+                             rtol = 0,
+                             atol = 1e-12,
+                             )
+        index = np.argmax(matches, axis=1)
+        index[~matches.any(axis=1)] = -1
+        return index
@@ -13,6 +13,8 @@ import pandas as pd
 
 from finance import security as sec
 from charting import ticker as tkr
+from charting import trading_defaults as dft
+from charting import price_store as pst
 
 def describe_run(tickers, date_range, span_dic, buffer_dic, strat_posns, fee_pct):
     '''print run description'''
@@ -30,14 +32,29 @@ def describe_run(tickers, date_range, span_dic, buffer_dic, strat_posns, fee_pct
 
 
 ### I/O ###
-def load_security(dirname, ticker, period, dates, refresh=False):
+def load_security(dirname, ticker, period, dates, refresh=False, store=dft.PRICE_STORE):
     '''
     Load data from file else upload from Yahoo finance
     dirname -> directory where pkl data is saved
     ticker -> Yahoo Finance ticker symbol
     period -> download period
     refresh -> True : download data from Yahoo / False use pickle data if it exists
+    store -> True: the Ticker is a view over the price history of ticker in
+             its PriceStore files, brought up to date (see PriceStore.sync)
+             if they do not cover dates. False: one pickled Ticker per date range
     '''
+    if store:
+        prices = pst.PriceStore(dirname)
+        if refresh:
+            prices.write(ticker, sec.Security(ticker, period), period)
+        elif not prices.covers(ticker, period, dates):
+            # only the bars since the last stored day
+            prices.sync(ticker, period)
+        return tkr.Ticker(symbol   = ticker,
+                          security = prices.get_security(ticker, period),
+                          dates    = dates,
+                          )
+
     protocol = 'pkl' #json or pkl (json pending)
     dirname = os.path.join(dirname, ticker)
     ticker_filename = ticker + f'_{dates[0]}-{dates[1]}_raw'
@@ -13,11 +13,10 @@ trading_driver.py
 import time
 from datetime import datetime
 from datetime import timedelta
-import pandas as pd
-import trading as tra
-import trading_plots as trp
-import trading_defaults as dft
-import utilities as util
+from charting import trading as tra
+from charting import trading_defaults as dft
+from charting import topo_map as tpm
+from finance import utilities as util
 
 N_MAXIMA_SAVE = 20 # number of maxima to save to file
 
@@ -27,6 +26,12 @@ START_DATE = '2017-07-07' # Friday
 END_DATE   = '2021-04-06'
 INCREMENT  = 28
 INCREMENT_START = False
+STRAT_POS  = 'long'
+PLOT_FORMAT = 'png'
+N_WORKERS  = 4 # processes used to build each ema map (1: no process pool)
+# True: build a single prefix index over START_DATE - END_DATE and read the
+# map of each window from it (EMAs are not restarted at each window start)
+PREFIX_INDEX = False
 
 def describe_run(tickers):
     span_range   = dft.MAX_SPAN - dft.MIN_SPAN + 1
@@ -47,36 +52,46 @@ if __name__ == '__main__':
 
     date_range = [start_dt, end_dt] # datetime format
 
+    if PREFIX_INDEX:
+        full_range = [start_dt, datetime.strptime(END_DATE, '%Y-%m-%d')]
+        ticker_obj = tra.load_security(dirname = dft.DATA_DIR,
+                                       ticker  = ticker,
+                                       refresh = False,
+                                       period  = 'max',
+                                       dates   = util.dates_to_strings(full_range, '%Y-%m-%d'),
+                                       )
+        index_map = tpm.Topomap(ticker, full_range, STRAT_POS)
+        if not index_map.load_prefix_index(ticker_obj.get_close()):
+            index_map.build_prefix_index(ticker_obj.get_close())
+
     while date_range[1] <= datetime.strptime(END_DATE, '%Y-%m-%d'):
         try:
-            # Get data and reformat
-            raw, ticker_name = tra.load_security(dirname = dft.DATA_DIR,
-                                                 ticker  = ticker,
-                                                 refresh = True,
-                                                 period  = 'max',
-                                                 )
-            security = pd.DataFrame(raw[f'Close_{ticker}'])
-            security.rename(columns={f'Close_{ticker}': "Close"}, inplace=True)
-
-            spans, buffers, emas, hold = tra.build_ema_map(ticker,
-                                                           security,
-                                                           date_range,)
+            if PREFIX_INDEX:
+                topomap = index_map.window_topomap(date_range[0], date_range[1])
+            else:
+                # Get data
+                dates = util.dates_to_strings(date_range, '%Y-%m-%d')
+                ticker_obj = tra.load_security(dirname = dft.DATA_DIR,
+                                               ticker  = ticker,
+                                               refresh = False,
+                                               period  = 'max',
+                                               dates   = dates,
+                                               )
 
-            # Plot EMA contour map
-            trp.plot_buffer_span_contours(ticker, ticker_name, date_range,
-                                          spans, buffers,
-                                          emas, hold,
-                                          )
+                topomap = tpm.Topomap(ticker, date_range, STRAT_POS)
+                topomap.build_ema_map(ticker_obj.get_close(),
+                                      date_range,
+                                      n_workers = N_WORKERS,
+                                      )
+            topomap.build_best_emas(N_MAXIMA_SAVE)
 
-            # Plot EMA 3D map
-            trp.plot_buffer_span_3D(ticker, ticker_name, date_range,
-                                    spans, buffers,
-                                    emas, hold,
-                                    dft.SURFACE_COLOR_SCHEME,
-                                    azim  = dft.PERSPECTIVE[0],
-                                    elev  = dft.PERSPECTIVE[1],
-                                    rdist = dft.PERSPECTIVE[2],
-                                    )
+            # Plot EMA contour map & 3D map
+            for style in ['contour', 'surface']:
+                topomap.surface_plot(ticker_object = ticker_obj,
+                                     date_range    = date_range,
+                                     style         = style,
+                                     plot_fmt      = PLOT_FORMAT,
+                                     )
 
             msg  = f'{ticker} running time: '
             msg += f'{util.convert_seconds(time.time()-save_tm)} | '
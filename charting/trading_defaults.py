@@ -52,11 +52,108 @@ BUFFER_DIC = dict({'min': MIN_BUFF,
                    })
 
 INIT_WEALTH   = 100.0 # index value at time t0
+TRADING_DAYS  = 252 # trading days per year (annualized Sharpe ratios)
 
 N_MAXIMA_SAVE = 20 # number of maxima to save to file
 
 FEE_PCT        = .004  # broker's fee
 
+# fee levels & execution lags of the EMA map cube (Topomap.build_ema_cube)
+CUBE_FEES = [0., .001, .002, .003, .004, .005, .0075, .01]
+CUBE_LAGS = [1, 2, 3, 5] # lag 0 trades on the close of its own signal (look-ahead)
+
+# float type of the EMA map prefix index (Topomap.build_prefix_index)
+PREFIX_DTYPE = 'float32'
+
+# walk-forward evaluation (Topomap.walk_forward): trading days of the
+# window the best EMA is picked from & of the period it is traded over
+WF_TRAIN_DAYS = 252
+WF_TEST_DAYS  = 21
+
+# bootstrap robustness maps (Topomap.build_robustness_maps)
+ROBUST_PATHS       = 500 # resampled price paths
+ROBUST_BLOCK_DAYS  = 21  # length of the resampled blocks of daily returns
+ROBUST_PERCENTILES = [5, 25, 50, 75, 95]
+ROBUST_MAX_MB      = 32  # workspace of a chunk of paths: small chunks stay in cache
+
+# tiled EMA maps of large grids (Topomap.build_tiled_map)
+TILE_MAX_MB = 64 # memory of a tile: EMAs of its spans & workspace of its buffers
+
+# panel of tickers on a shared calendar (Topomap.build_panel_maps)
+PANEL_MAX_MB = 256 # workspace of a chunk of tickers evaluated at once
+
+# synthetic price paths (Topomap._resample_paths):
+# bootstrap -> moving block bootstrap of the daily returns
+# sign -> daily returns in order with random signs
+# block -> permutation of blocks of daily returns
+PATH_METHODS = ['bootstrap', 'sign', 'block']
+# reality check of the best EMA (Topomap.test_significance)
+SIG_METHODS = PATH_METHODS[1:]
+SIG_METHOD  = SIG_METHODS[0]
+SIG_PERMUTATIONS = 500
+
+# EMA map evaluation engine:
+# grid -> batched numpy evaluation of all buffers of a span
+# strategy -> one build_strategy() dataframe per span/buffer
+MAP_ENGINES = ['grid', 'strategy']
+MAP_ENGINE  = MAP_ENGINES[0]
+N_WORKERS   = 1 # processes for the grid engine, 1 -> no process pool
+BLOCKS_PER_WORKER = 4 # span blocks per process
+N_TICKERS   = 1 # securities prepared concurrently by charting_run, 1 -> sequential
+INCREMENTAL_MAP = True # extend saved map states to new end dates
+MAP_STATS = True # build the statistics layers with the grid engine's EMA map
+
+# strategy families of Topomap maps: y axis title, x axis title & x tick format
+# ema -> price vs EMA / sma -> price vs SMA / crossover -> fast vs slow mean
+MAP_FAMILIES = {'ema'      : ('Span (days)', 'Buffer', '.0%'),
+                'sma'      : ('Span (days)', 'Buffer', '.0%'),
+                'crossover': ('Fast span (days)', 'Slow span (days)', '.0f'),
+                }
+CROSSOVER_BUFFER = 0.0   # band around the slow mean of a crossover
+CROSSOVER_MEAN   = 'EMA' # EMA or SMA means of a crossover
+
+# strategy plugins of the grid engine (see strategies.make_strategy):
+# mean type followed by the band position rule or the volume filter
+MAP_STRATEGIES = ['ema', 'sma', 'ema_band', 'sma_band', 'ema_volume', 'sma_volume']
+VOLUME_WINDOW  = 20  # days of the mean volume of the volume filter
+VOLUME_FACTOR  = 1.0 # signals fire when the volume is >= factor x mean volume
+
+# EMA map layers: label, plotly tick format & ranking direction
+# (1: highest is best, -1: lowest is best) of build_best_emas & surface_plot
+MAP_LAYERS = {'ema'     : ('Return', '.0%', 1),
+              'sharpe'  : ('Sharpe ratio', '.2f', 1),
+              'drawdown': ('Max drawdown', '.0%', 1),
+              'exposure': ('Time in market', '.0%', -1),
+              'trades'  : ('Trades', '.0f', -1),
+              }
+
+# Best EMA search: full grid, coarse-to-fine lattice, full grids of all
+# the securities of a portfolio in one panel pass or full grid in
+# memory-bounded tiles (large grids). The coarse-to-fine search is
+# approximate: it can miss the best cell of the full grid
+SEARCH_MODES = ['grid', 'coarse', 'panel', 'tiled']
+SEARCH_MODE  = SEARCH_MODES[0]
+SEARCH_SPAN_POINTS = 20 # geometrically spaced spans of the coarse lattice
+SEARCH_SPAN_STEP   = 8  # span radius of the first refinement
+SEARCH_BUFFER_STEP = 4  # coarse lattice step & buffer radius of the first refinement
+SEARCH_SEEDS       = 40 # best cells refined at each step of the search
+
+# EMA map file format: npy (binary + json header) or csv (; separated)
+EMA_MAP_FORMATS = ['npy', 'csv']
+EMA_MAP_FORMAT  = EMA_MAP_FORMATS[0]
+
+# Price history: one columnar store per symbol (see price_store)
+# False -> one pickled Ticker per ticker & date range
+PRICE_STORE = True
+SYNC_OVERLAP_DAYS = 5    # stored days downloaded again to detect adjustments
+SYNC_RTOL         = 1e-4 # relative change of an overlapping adjusted close that
+                         # triggers a full download (dividend or split)
+
+# Content-addressed EMA map cache: maps keyed on price data & all parameters
+EMA_CACHE        = True # False -> maps are only keyed on ticker, dates & position
+EMA_CACHE_DIR    = 'ema_cache' # under DATA_DIR
+EMA_CACHE_MAX_MB = 512 # least recently used maps are evicted beyond this size
+
 #### PLOT DEFAULTS ####
 # Bokeh Time series
 # STATS_LEVEL = .05 # p-value level
@@ -226,7 +226,7 @@ def build_range_plot(ticker_object, topomap, dfr, fixed, hold, min_max, n_best,
     axis = build_title(axis        = axis,
                        ticker      = ticker_object.get_symbol(),
                        ticker_name = ticker_object.get_name(),
-                       position = topomap.get_position(),
+                       position = topomap.get_strategic_position(),
                        dates    = util.dates_to_strings(date_range, fmt = '%d-%b-%Y'),
                        ema      = min_max[1],
                        hold     = hold,
@@ -258,7 +258,7 @@ def plot_span_range(ticker_object, topomap, security, buffer, n_best, fee_pct):
                                            var_name  = target,
                                            variables = spans,
                                            fixed     = fixed,
-                                           fpct      = fee_pct,
+                                           fee       = fee_pct,
                                            )
 
     dfr = pd.DataFrame(data=[spans, emas]).T
@@ -297,7 +297,7 @@ def plot_buffer_range(ticker_object, topomap, security, span, n_best, fee_pct):
                                            var_name   = target,
                                            variables  = buffers,
                                            fixed      = fixed,
-                                           fpct       = fee_pct,
+                                           fee        = fee_pct,
                                            )
 
     dfr = pd.DataFrame(data=[buffers, emas]).T
@@ -317,6 +317,155 @@ def plot_buffer_range(ticker_object, topomap, security, span, n_best, fee_pct):
                      max_fmt,
                      )
 
+def plot_cube_slice(ticker_object, topomap, fee=None, lag=None, n_maxima=dft.N_MAXIMA_DISPLAY):
+    '''
+    Contour plot of the EMA map of the cube (see Topomap.build_ema_cube)
+    for a broker's fee & an execution lag (the topomap's fee & LAG if None)
+    '''
+    fee  = topomap.get_fee_pct() if fee is None else fee
+    lag  = dft.LAG if lag is None else lag
+    emas = topomap.get_cube_slice(fee, lag)
+    spans, buffers = topomap.get_spans(), topomap.get_buffers()
+
+    fig, axis = plt.subplots(figsize=(dft.CONTOUR_WIDTH, dft.FIG_HEIGHT))
+    contours = axis.contourf(buffers, spans, emas,
+                             levels = dft.N_CONTOURS,
+                             cmap   = dft.CONTOUR_COLOR_SCHEME,
+                             )
+    fig.colorbar(contours, ax=axis, format=mtick.PercentFormatter(xmax=1))
+    axis = build_3d_axes_labels(axis)
+    max_ema, max_span, max_buff = plot_maxima(emas, spans, buffers, axis, n_maxima)
+
+    dates = util.dates_to_strings(topomap.get_date_range(), fmt = '%d-%b-%Y')
+    axis  = build_title(axis        = axis,
+                        ticker      = ticker_object.get_symbol(),
+                        ticker_name = ticker_object.get_name(),
+                        position    = topomap.get_strategic_position(),
+                        dates       = dates,
+                        ema         = max_ema,
+                        hold        = topomap.get_hold(),
+                        span        = max_span,
+                        buffer      = max_buff,
+                        )
+    axis.set_title(axis.get_title() + f' | fee={fee:.2%} | lag={lag} day(s)',
+                   fontsize = dft.TITLE_SIZE,
+                   color    = dft.TITLE_COLOR,
+                   )
+
+    dates    = util.dates_to_strings(topomap.get_date_range(), fmt = '%Y-%m-%d')
+    filename = f'{ticker_object.get_symbol()}_{dates[0]}_{dates[1]}'
+    filename += f'_{topomap.get_strategic_position()}_fee{fee:.4f}_lag{lag}'
+    save_figure(os.path.join(dft.PLOT_DIR, ticker_object.get_symbol()), filename)
+
+
+def plot_cube_sensitivity(ticker_object, topomap):
+    '''
+    Best EMA return of the map as a function of the broker's fee,
+    one line per execution lag of the cube (see Topomap.build_ema_cube)
+    '''
+    cube, fees, lags = topomap.get_cube()
+    best = cube.max(axis=(0, 1)) # (fees x lags)
+
+    _, axis = plt.subplots(figsize=(dft.FIG_WIDTH, dft.FIG_HEIGHT))
+    for k, lag in enumerate(lags):
+        axis.plot(fees, best[:, k], marker='o', linewidth=1, label=f'lag={lag} day(s)')
+    axis.axhline(topomap.get_hold(), color=dft.VLINE_COLOR, linestyle='--', label='hold')
+    axis.legend(loc='best')
+    axis.set_xlabel("broker's fee")
+    axis.set_ylabel('best EMA return')
+    for axis_fmt in [axis.xaxis, axis.yaxis]:
+        axis_fmt.set_major_formatter(mtick.PercentFormatter(xmax=1))
+    axis.grid(which='major', axis='both', color=dft.GRID_COLOR)
+
+    dates = util.dates_to_strings(topomap.get_date_range(), fmt = '%d-%b-%Y')
+    title  = f'{ticker_object.get_name()} ({ticker_object.get_symbol()}) | '
+    title += f'{topomap.get_strategic_position().capitalize()} position | '
+    title += f'{dates[0]} - {dates[1]}\nFee & execution lag sensitivity'
+    axis.set_title(title, fontsize = dft.TITLE_SIZE, color = dft.TITLE_COLOR)
+
+    dates    = util.dates_to_strings(topomap.get_date_range(), fmt = '%Y-%m-%d')
+    filename = f'{ticker_object.get_symbol()}_{dates[0]}_{dates[1]}'
+    filename += f'_{topomap.get_strategic_position()}_fee_lag'
+    save_figure(os.path.join(dft.PLOT_DIR, ticker_object.get_symbol()), filename)
+
+def plot_robustness_map(ticker_object, topomap, layer='p_beat_hold', n_maxima=dft.N_MAXIMA_DISPLAY):
+    '''
+    Contour plot of a bootstrap robustness map (see Topomap.build_robustness_maps)
+    layer -> 'p_beat_hold' (fraction of paths beating hold) or a percentile
+    '''
+    robust = topomap.get_robustness_maps()
+    if layer == 'p_beat_hold':
+        emas, label = robust['p_beat_hold'], 'P(EMA > hold)'
+    elif layer in robust['percentiles']:
+        emas, label = robust['percentiles'][layer], f'{layer}th percentile return'
+    else:
+        msg = f"layer {layer} should be p_beat_hold or in {list(robust['percentiles'])}"
+        raise ValueError(msg)
+    spans, buffers = topomap.get_spans(), topomap.get_buffers()
+
+    fig, axis = plt.subplots(figsize=(dft.CONTOUR_WIDTH, dft.FIG_HEIGHT))
+    contours = axis.contourf(buffers, spans, emas,
+                             levels = dft.N_CONTOURS,
+                             cmap   = dft.CONTOUR_COLOR_SCHEME,
+                             )
+    fig.colorbar(contours, ax=axis, format=mtick.PercentFormatter(xmax=1))
+    axis = build_3d_axes_labels(axis)
+    max_ema, max_span, max_buff = plot_maxima(emas, spans, buffers, axis, n_maxima)
+
+    dates  = util.dates_to_strings(topomap.get_date_range(), fmt = '%d-%b-%Y')
+    title  = f'{ticker_object.get_name()} ({ticker_object.get_symbol()}) | '
+    title += f'{topomap.get_strategic_position().capitalize()} position | '
+    title += f'{dates[0]} - {dates[1]}\n'
+    title += f"{robust['returns'].shape[0]} bootstrap paths | {label}: "
+    title += f'{max_ema:.2%} at span={max_span:.0f} days, buffer={max_buff:.2%}'
+    axis.set_title(title, fontsize = dft.TITLE_SIZE, color = dft.TITLE_COLOR)
+
+    dates    = util.dates_to_strings(topomap.get_date_range(), fmt = '%Y-%m-%d')
+    filename = f'{ticker_object.get_symbol()}_{dates[0]}_{dates[1]}'
+    filename += f'_{topomap.get_strategic_position()}_robust_{layer}'
+    save_figure(os.path.join(dft.PLOT_DIR, ticker_object.get_symbol()), filename)
+
+
+def plot_walk_forward(ticker_object, topomap, equity):
+    '''
+    Out-of-sample equity of the walk-forward evaluation against hold (top)
+    and path of the span & buffer traded (bottom), see Topomap.walk_forward
+    '''
+    fig, (axis, path_axis) = plt.subplots(2, 1,
+                                          figsize = (dft.FIG_WIDTH, dft.FIG_HEIGHT),
+                                          sharex  = True,
+                                          gridspec_kw = {'height_ratios': [2, 1]},
+                                          )
+    axis.plot(equity.index, equity.EQUITY, linewidth=1, label='walk-forward EMA')
+    axis.plot(equity.index, equity.HOLD, color=dft.VLINE_COLOR, linewidth=1, label='hold')
+    axis.legend(loc='best')
+    axis.set_ylabel('wealth')
+    axis.grid(which='major', axis='both', color=dft.GRID_COLOR)
+
+    path_axis.step(equity.index, equity.SPAN, where='post', linewidth=1)
+    path_axis.set_ylabel('span (days)')
+    buffer_axis = path_axis.twinx()
+    buffer_axis.step(equity.index, equity.BUFFER, where='post', linewidth=1,
+                     color=dft.VLINE_COLOR, linestyle='--')
+    buffer_axis.set_ylabel('buffer')
+    buffer_axis.yaxis.set_major_formatter(mtick.PercentFormatter(xmax=1))
+    path_axis.grid(which='major', axis='both', color=dft.GRID_COLOR)
+
+    oos  = equity.EQUITY.iloc[-1]/equity.EQUITY.iloc[0] - 1
+    hold = equity.HOLD.iloc[-1]/equity.HOLD.iloc[0] - 1
+    dates = util.dates_to_strings([equity.index[0], equity.index[-1]], fmt = '%d-%b-%Y')
+    title  = f'{ticker_object.get_name()} ({ticker_object.get_symbol()}) | '
+    title += f'{topomap.get_strategic_position().capitalize()} position | '
+    title += f'{dates[0]} - {dates[1]}\n'
+    title += f'Walk-forward EMA: {oos:.2%} | hold: {hold:.2%}'
+    axis.set_title(title, fontsize = dft.TITLE_SIZE, color = dft.TITLE_COLOR)
+    fig.align_ylabels()
+
+    dates    = util.dates_to_strings(topomap.get_date_range(), fmt = '%Y-%m-%d')
+    filename = f'{ticker_object.get_symbol()}_{dates[0]}_{dates[1]}'
+    filename += f'_{topomap.get_strategic_position()}_walk_forward'
+    save_figure(os.path.join(dft.PLOT_DIR, ticker_object.get_symbol()), filename)
+
 ### I/O
 def save_figure(plot_dir, prefix, dpi=360, extension='png'):
     '''
@@ -91,6 +91,25 @@ class ChartingParameters():
         return parameters
 
 
+    def get_engine_parameters(self):
+        '''
+        Returns EMA map engine parameters as a dictionary
+        Keys missing from the yaml file take their charting defaults
+        '''
+        defaults = {'n_workers': dft.N_WORKERS,
+                    'n_tickers': dft.N_TICKERS,
+                    'search_mode': dft.SEARCH_MODE,
+                    'map_plots': True,
+                    'walk_forward': False,
+                    'significance': 0,
+                    'tile_mb': dft.TILE_MAX_MB,
+                    }
+        parameters = {}
+        for par, default in defaults.items():
+            parameters[par] = self._yaml_data.get(par, default)
+        return parameters
+
+
     def get_smtp_parameters(self):
         '''Returns smtp-related parameters as a dictionary'''
         smtp_parameters={}
@@ -117,6 +136,7 @@ if __name__ == '__main__':
     recommender_parameters = charting_parameters.get_recommender_parameters()
     display_parameters     = charting_parameters.get_display_parameters()
     refresh_parameters     = charting_parameters.get_refresh_parameters()
+    engine_parameters      = charting_parameters.get_engine_parameters()
     ssl_port    = charting_parameters.get_smtp_parameters()['ssl_port']
     smtp_server = charting_parameters.get_smtp_parameters()['smtp_server']
     db_ip       = charting_parameters.get_db_parameters()['db_ip']
@@ -127,6 +147,7 @@ if __name__ == '__main__':
     print(recommender_parameters)
     print(display_parameters)
     print(refresh_parameters)
+    print(engine_parameters)
     print(recipients)
     print(time_span)
     print(ssl_port)
@@ -12,11 +12,10 @@ sync_tickers.py
 import sys
 import time
 import pandas as pd
-from charting import trading as tra
-from charting import trading_defaults as dft
-from charting import topo_map as tpm
+from charting import trading_plots as trplt
 from charting import time_series_plot as tsp
 from charting import holdings as hld
+from charting import scheduler as sch
 import recommender as rec
 import charting_parameters as par
 from finance import utilities as util
@@ -37,6 +36,17 @@ if __name__ == '__main__':
     REFRESH_YAHOO = yaml_pars.get_refresh_parameters()['refresh_yahoo']
     REFRESH_EMA   = yaml_pars.get_refresh_parameters()['refresh_ema']
     PERSIST       = yaml_pars.get_db_parameters()['persist']
+    N_WORKERS     = yaml_pars.get_engine_parameters()['n_workers']
+    N_TICKERS     = yaml_pars.get_engine_parameters()['n_tickers']
+    SEARCH_MODE   = yaml_pars.get_engine_parameters()['search_mode']
+    # memory budget (MB) of a tile of the 'tiled' search mode
+    TILE_MB       = yaml_pars.get_engine_parameters()['tile_mb']
+    # contour & surface plots need the full map: a coarse search falls back to it
+    MAP_PLOTS     = yaml_pars.get_engine_parameters()['map_plots']
+    # out-of-sample check of the best EMA choice (Topomap.walk_forward)
+    WALK_FORWARD  = yaml_pars.get_engine_parameters()['walk_forward']
+    # permutations of the reality check of the best EMA, 0 -> no test
+    SIGNIFICANCE  = yaml_pars.get_engine_parameters()['significance']
 
     print(f'*** run time span: {DATE_RANGE} ***\n')
 
@@ -49,54 +59,63 @@ if __name__ == '__main__':
                                       email          = EMAIL,
                                       )
 
-        for i, security in enumerate(securities.Ticker):
-            strategic_pos = securities.iloc[i].Strategy.strip()
+        scheduled = sch.schedule_securities(securities    = securities,
+                                            dates         = DATE_RANGE,
+                                            refresh_yahoo = REFRESH_YAHOO,
+                                            refresh_ema   = REFRESH_EMA,
+                                            n_tickers     = N_TICKERS,
+                                            n_workers     = N_WORKERS,
+                                            search_mode   = SEARCH_MODE,
+                                            tile_mb       = TILE_MB,
+                                            )
+        for i, security, strategic_pos, prepared, error in scheduled:
             msg  = f'Security {i+1}/{len(securities)}: {security} | '
             msg += f'Strategic position: {strategic_pos} | '
             msg += f'Position: {securities.iloc[i].Position.strip()}'
             print(msg)
+            if error is not None: # download or map failed in the scheduler
+                sch.print_exception(security, error)
+                continue
             try:
-                ticker_obj = tra.load_security(dirname = dft.DATA_DIR,
-                                               ticker  = security,
-                                               refresh = REFRESH_YAHOO,
-                                               period  = dft.DEFAULT_PERIOD,
-                                               dates   = DATE_RANGE,
-                                               )
-                volume = ticker_obj.get_volume()
-
-                # Convert dates to datetime
-                date_range = util.get_date_range(ticker_obj.get_close(),
-                                                 DATE_RANGE[0],
-                                                 DATE_RANGE[1],
-                                                 )
-
-                # Instantiate a Topomap object
-                topomap = tpm.Topomap(security, date_range, strategic_pos)
-
-                # Read EMA map values from file or compute if not saved
-                topomap.load_ema_map(ticker_object = ticker_obj,
-                                     refresh       = REFRESH_EMA,
-                                     )
-
-                # Build & save best EMA results to file
-                topomap.build_best_emas(dft.N_MAXIMA_SAVE)
-
-                # Plot EMA contour map
-                ctr_plot = topomap.surface_plot(ticker_object = ticker_obj,
-                                                date_range = date_range,
-                                                style  = 'contour',
-                                                plot_fmt = PLOT_FORMATS,
-                                                )
-
-                # Plot EMA 3D map
-                sfc_plot = topomap.surface_plot(ticker_object = ticker_obj,
-                                                date_range = date_range,
-                                                style  = 'surface',
-                                                plot_fmt = PLOT_FORMATS,
-                                                )
+                # Downloaded data, EMA map & best EMAs from the scheduler
+                ticker_obj, date_range, topomap = prepared
+
+                if MAP_PLOTS:
+                    # Plot EMA contour map
+                    ctr_plot = topomap.surface_plot(ticker_object = ticker_obj,
+                                                    date_range = date_range,
+                                                    style  = 'contour',
+                                                    plot_fmt = PLOT_FORMATS,
+                                                    )
+
+                    # Plot EMA 3D map
+                    sfc_plot = topomap.surface_plot(ticker_object = ticker_obj,
+                                                    date_range = date_range,
+                                                    style  = 'surface',
+                                                    plot_fmt = PLOT_FORMATS,
+                                                    )
 
                 # Get optimal span/buffer
                 best_span, best_buffer, best_ema, hold = topomap.get_global_max()
+                if SIGNIFICANCE > 0:
+                    significance = topomap.test_significance(ticker_obj.get_close(),
+                                                             n_permutations = SIGNIFICANCE,
+                                                             n_workers      = N_WORKERS,
+                                                             )
+                    msg  = f'Best EMA span={best_span:.0f} buffer={best_buffer:.2%}: '
+                    msg += f'{best_ema:.2%} vs hold {hold:.2%} | '
+                    msg += f"p-value {significance['p_value']:.3f} adjusted for the "
+                    msg += f"{topomap.get_emas().size} cells searched "
+                    msg += f"(single cell: {significance['naive_p_value']:.3f})"
+                    print(msg)
+
+                if WALK_FORWARD:
+                    equity, _ = topomap.walk_forward(ticker_obj.get_close())
+                    msg  = f'Walk-forward EMA: {equity.EQUITY.iloc[-1]/equity.EQUITY.iloc[0] - 1:.2%} | '
+                    msg += f'hold: {equity.HOLD.iloc[-1]/equity.HOLD.iloc[0] - 1:.2%} '
+                    msg += f'over {equity.index[0]:%Y-%m-%d} - {equity.index[-1]:%Y-%m-%d}'
+                    print(msg)
+                    trplt.plot_walk_forward(ticker_obj, topomap, equity)
 
                 # Convert zoom dates to datetime
                 date_zoom = util.get_date_range(ticker_obj.get_close(),
@@ -146,7 +165,7 @@ if __name__ == '__main__':
                 print(f'Could not process {security}: Exception={ex}')
                 print(sys.exc_info())
         # send notifications
-        email_plot_flags = {'ts': True, 'contour': True, 'surface': True}
+        email_plot_flags = {'ts': True, 'contour': MAP_PLOTS, 'surface': MAP_PLOTS}
         recommender.notify(screen_nc = True,  # display n/c positions to screen
                            email_nc  = False, # email n/c positions
                            email_plot_flags = email_plot_flags,
@@ -33,6 +33,7 @@ PLOT_FORMATS = par.CTR_SFC_PLOT_FORMATS
 DISPLAY_TIME_SERIES = par.DISPLAY_TIME_SERIES
 REFRESH_YAHOO = par.REFRESH_YAHOO
 REFRESH_EMA   = par.REFRESH_EMA
+N_WORKERS     = par.N_WORKERS
 
 
 if __name__ == '__main__':
@@ -59,30 +60,38 @@ if __name__ == '__main__':
 
     for i, ticker in enumerate(TICKERS):
         print(f'{i+1}/{len(TICKERS)}: {ticker}')
+        try:
+            ticker_obj = tra.load_security(dirname = dft.DATA_DIR,
+                                           ticker  = ticker,
+                                           refresh = REFRESH_YAHOO,
+                                           period  = dft.DEFAULT_PERIOD,
+                                           dates   = DATE_RANGE,
+                                           )
+            volume = ticker_obj.get_volume()
+
+            # Convert dates to datetime
+            date_range = util.get_date_range(ticker_obj.get_close(),
+                                             DATE_RANGE[0],
+                                             DATE_RANGE[1],
+                                             )
+
+            # Read EMA map values from file or compute the maps
+            # of all strategic positions in a single pass
+            topomaps = tpm.Topomap.load_ema_maps(ticker_object = ticker_obj,
+                                                 date_range    = date_range,
+                                                 positions     = POSITIONS,
+                                                 refresh       = REFRESH_EMA,
+                                                 n_workers     = N_WORKERS,
+                                                 )
+        except Exception as ex:
+            print(f'Could not process {ticker}: Exception={ex}')
+            print(sys.exc_info())
+            continue
+
         for strat_pos in POSITIONS:
             print(f'Strategic position: {strat_pos}')
             try:
-                ticker_obj = tra.load_security(dirname = dft.DATA_DIR,
-                                               ticker  = ticker,
-                                               refresh = REFRESH_YAHOO,
-                                               period  = dft.DEFAULT_PERIOD,
-                                               dates   = DATE_RANGE,
-                                               )
-                volume = ticker_obj.get_volume()
-
-                # Convert dates to datetime
-                date_range = util.get_date_range(ticker_obj.get_close(),
-                                                 DATE_RANGE[0],
-                                                 DATE_RANGE[1],
-                                                 )
-
-                # Instantiate a Topomap object
-                topomap = tpm.Topomap(ticker, date_range, strat_pos)
-
-                # # Read EMA map values  from file or compute if not saved
-                topomap.load_ema_map(ticker_object = ticker_obj,
-                                     refresh       = REFRESH_EMA,
-                                     )
+                topomap = topomaps[strat_pos]
 
                 # Build & save best EMA results to file
                 topomap.build_best_emas(dft.N_MAXIMA_SAVE)
@@ -24,7 +24,12 @@ class Security(eq.Equity):
     ''' A Security is an object resulting from Yahoo finance download using yfinance
         - Provides ease of access to relevant variables
     '''
-    def __init__(self, symbol, period):
+    def __init__(self, symbol, period, start=None, info=True):
+        '''
+        period -> download period ending today
+        start -> first date of the download (datetime), the start of period if None
+        info -> also load the name, currency & type of the security
+        '''
         print(f'Loading ticker {symbol}')
         super().__init__()
         self.data['symbol'] = symbol
@@ -38,12 +43,13 @@ class Security(eq.Equity):
             print(traceback.format_exc())
         else:
             self.history = yf.download(symbol,
-                                       util.get_start(period),
+                                       util.get_start(period) if start is None else start,
                                        dt.datetime.now(),
                                        interval='1d')
-            self.data['name']     = self.ticker.info['shortName']
-            self.data['currency'] = self.ticker.info['currency']
-            self.data['type']     = self.ticker.info['quoteType']
+            if info:
+                self.data['name']     = self.ticker.info['shortName']
+                self.data['currency'] = self.ticker.info['currency']
+                self.data['type']     = self.ticker.info['quoteType']
             self._set_mkt_data()
 
 
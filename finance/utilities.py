@@ -7,7 +7,9 @@ All-purpose use utilities
 
 @author: charles mégnin
 """
+import sys
 import time
+from contextlib import contextmanager
 from datetime import datetime
 import pprint
 import math
@@ -281,6 +283,36 @@ def dates_to_strings(date_range, fmt='%d-%b-%Y'):
     # end_string   = end.strftime(fmt)
     return [date_to_string(date_range[0], fmt), date_to_string(date_range[1], fmt)]
 
+def peak_rss():
+    '''Peak resident set size of the process in MB, None where unavailable'''
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+@contextmanager
+def file_lock(pathname):
+    '''
+    Exclusive lock of pathname across processes, held within the with block
+    No lock where fcntl is unavailable (Windows)
+    '''
+    try:
+        import fcntl
+    except ImportError: # Windows
+        yield
+        return
+    with open(pathname, 'a', encoding='utf-8') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def print_running_time(ticker, start_tm, save_tm):
     '''Called by trading_driver for leap time'''
     msg  = f'{ticker} running time: '